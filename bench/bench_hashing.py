@@ -0,0 +1,56 @@
+"""ハッシュ化のベンチマーク
+
+ID列のように同じ値が何度も出てくる列を作り、以前の df[column].apply(hash_value) と
+utils/hashing.py の各アルゴリズムを比べる。SHA-256の結果が以前と一致することも確認する。
+
+使い方（リポジトリのルートで実行）:
+    python -m bench.bench_hashing
+    python -m bench.bench_hashing --rows 5000000 --unique 500000
+"""
+import argparse
+import hashlib
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.hashing import ALGORITHMS, hash_series
+
+
+def hash_value(value):
+    """以前の実装（pages/1_hashpage.py）"""
+    value = str(value)
+    if pd.isna(value):
+        return value
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5_000_000, help="行数")
+    parser.add_argument("--unique", type=int, default=500_000, help="ユニークな値の数")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（省略時はCPU数）")
+    parser.add_argument("--skip-reference", action="store_true", help="以前の実装の計測を省く（遅いため）")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ids = pd.Series(rng.integers(0, args.unique, size=args.rows)).map("C{:08d}".format)
+    print(f"{args.rows:,}行 / ユニーク {ids.nunique():,}件")
+
+    expected = None
+    if not args.skip_reference:
+        start = time.perf_counter()
+        expected = ids.apply(hash_value)
+        print(f"{'以前（apply + SHA-256）':<28} {time.perf_counter() - start:>7.2f}秒")
+
+    for label, algorithm in ALGORITHMS.items():
+        key = "benchmark-key" if algorithm == "hmac-sha256" else None
+        start = time.perf_counter()
+        result = hash_series(ids, algorithm, key, workers=args.workers)
+        print(f"{label:<28} {time.perf_counter() - start:>7.2f}秒")
+        if algorithm == "sha256" and expected is not None:
+            assert result.equals(expected), "SHA-256の結果が以前の実装と一致しません"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""HTML解析のベンチマーク
+
+保存済みのHTML（bench/fixtures）を使い、以前の BeautifulSoup(html.parser) による解析と
+utils/parsing.py の解析を比べる。取り出した項目が完全に一致することも確認する。
+
+使い方（リポジトリのルートで実行）:
+    python -m bench.bench_parsing
+    python -m bench.bench_parsing --repeat 500
+"""
+import argparse
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from utils import parsing
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def reference_cosme_review_links(html):
+    """以前の実装（pages/2_atcosme.py）"""
+    soup = BeautifulSoup(html, "html.parser")
+    return [element.get("href") for element in soup.select("span.read-more a.cmn-viewmore")]
+
+
+def reference_cosme_review_fields(html):
+    """以前の実装（pages/2_atcosme.py）"""
+    soup = BeautifulSoup(html, "html.parser")
+    review_text = soup.select_one("p.read").get_text().strip()
+    rating = None
+    if soup.select_one("div.rating.clearfix p.reviewer-rating"):
+        rating = soup.select_one("div.rating.clearfix p.reviewer-rating").extract().text
+    reviewer_info = soup.select_one("div.reviewer-info")
+    return {
+        "comment": review_text,
+        "rating": rating,
+        "reviewer_info": reviewer_info.text.strip() if reviewer_info else None,
+    }
+
+
+def reference_qoo10_reviews(html):
+    """以前の実装（pages/3_qoo10.py）"""
+    soup = BeautifulSoup(html, "html.parser")
+    texts = [review.text.strip() for review in soup.find_all("p", class_="review_txt")]
+    return texts, soup.find("div", id="pagingQA") is not None
+
+
+CASES = [
+    ("cosme_list.html", reference_cosme_review_links, parsing.cosme_review_links),
+    ("cosme_review.html", reference_cosme_review_fields, parsing.cosme_review_fields),
+    ("qoo10_goods.html", reference_qoo10_reviews, parsing.qoo10_reviews),
+]
+
+
+def timeit(func, html, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200, help="1ケースあたりの繰り返し回数")
+    args = parser.parse_args()
+
+    has_lxml = parsing.HAS_LXML
+    print(f"{'fixture':<20} {'以前':>9} {'strainer':>9} {'lxml':>9} {'高速化':>7}")
+    for name, reference, target in CASES:
+        html = (FIXTURES / name).read_bytes()
+        expected = reference(html)
+
+        # lxmlなし（SoupStrainer）の経路も同じ結果になることを確認する
+        parsing.HAS_LXML = False
+        assert target(html) == expected, f"{name}: SoupStrainer版の結果が一致しません"
+        strainer_ms = timeit(target, html, args.repeat)
+
+        lxml_ms = None
+        if has_lxml:
+            parsing.HAS_LXML = True
+            assert target(html) == expected, f"{name}: lxml版の結果が一致しません"
+            lxml_ms = timeit(target, html, args.repeat)
+        parsing.HAS_LXML = has_lxml
+
+        reference_ms = timeit(reference, html, args.repeat)
+        best = lxml_ms if lxml_ms is not None else strainer_ms
+        lxml_text = f"{lxml_ms:>7.2f}ms" if lxml_ms is not None else f"{'-':>9}"
+        print(f"{name:<20} {reference_ms:>7.2f}ms {strainer_ms:>7.2f}ms {lxml_text} {reference_ms / best:>6.1f}x")
+    print("抽出結果はすべて一致しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""@cosmeのレビューを複数商品まとめて取得するコマンド
+
+使い方:
+    python cosme_batch.py product_ids.txt -o reviews.csv
+    python cosme_batch.py product_ids.txt -o reviews.parquet --workers 4 --pages 1000
+
+商品IDのファイルは1行に1つ（空行と # から始まる行は無視）。
+取得したレビューは届いた順にファイルへ書き出すので、商品数やページ数が増えてもメモリ使用量は変わらない。
+"""
+import argparse
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils.checkpoint import ScrapeCheckpoint
+from utils.cosme import COLUMNS, iter_reviews, to_frame
+from utils.fetcher import Fetcher
+from utils.http_cache import HttpCache
+
+# 書き込み待ちで溜めておく最大行数（これ以上溜まると取得側が待つ）
+QUEUE_SIZE = 1000
+# この行数ごとに年齢・肌タイプをまとめて取り出して書き出す
+BATCH_SIZE = 500
+
+_DONE = object()
+
+
+class CsvSink:
+    """バッチごとにCSVへ追記する"""
+
+    def __init__(self, path, encoding):
+        self._file = open(path, "w", newline="", encoding=encoding)
+        self._header = True
+
+    def write(self, df):
+        df.to_csv(self._file, header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """バッチごとにParquetの行グループとして書き出す"""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquetで出力するには pyarrow をインストールしてください")
+        self._pa = pa
+        self._schema = pa.schema([("product_id", pa.string()), ("score", pa.int64())]
+                                 + [(name, pa.string()) for name in COLUMNS[1:]])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, df):
+        self._writer.write_table(self._pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+
+def write_batch(sink, batch):
+    """取得した行をまとめて後処理してから書き出す"""
+    product_ids = [product_id for product_id, _ in batch]
+    df = to_frame(review for _, review in batch)
+    df.insert(0, "product_id", product_ids)
+    sink.write(df)
+
+
+def read_product_ids(path):
+    """商品IDファイルを読み込む"""
+    ids = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            ids.append(line)
+    return ids
+
+
+def put_unless_stopped(rows, item, stop):
+    """キューに入れる。書き込み側が止まった（stop が立った）ら入れずに False を返す"""
+    while not stop.is_set():
+        try:
+            rows.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def scrape_product(product_id, max_pages, fetcher, rows, resume, stop):
+    """1商品分のレビューを取得してキューに流す（stop が立ったら途中でやめる）"""
+    count = 0
+    try:
+        with ScrapeCheckpoint("cosme", product_id) as checkpoint:
+            if not resume:
+                checkpoint.clear()
+            for review in iter_reviews(product_id, max_pages, fetcher, checkpoint=checkpoint):
+                if not put_unless_stopped(rows, (product_id, review), stop):
+                    return
+                count += 1
+        print(f"{product_id}: {count}件", file=sys.stderr)
+    except Exception as e:
+        # 1商品の失敗で全体を止めない（完了したページまでは保存されているので再実行で続きから取得できる）
+        print(f"{product_id}: エラーが発生しました（{count}件まで取得済み）: {e}", file=sys.stderr)
+    finally:
+        put_unless_stopped(rows, _DONE, stop)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="@cosmeのレビューを複数商品まとめて取得します")
+    parser.add_argument("ids_file", help="商品IDを1行に1つ書いたファイル")
+    parser.add_argument("-o", "--output", required=True, help="出力ファイル（.csv または .parquet）")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="出力形式（省略時は拡張子で判定）")
+    parser.add_argument("--pages", type=int, default=1000, help="1商品あたりの最大ページ数")
+    parser.add_argument("--workers", type=int, default=2, help="同時に処理する商品数")
+    parser.add_argument("--concurrency", type=int, default=8, help="@cosmeへの同時接続数")
+    parser.add_argument("--interval", type=float, default=0.2, help="リクエストの最小間隔（秒）")
+    parser.add_argument("--encoding", default="utf-8-sig", help="CSVの文字コード")
+    parser.add_argument("--no-cache", action="store_true", help="HTTPキャッシュを使わない")
+    parser.add_argument("--no-resume", action="store_true", help="途中経過を捨てて最初から取得する")
+    args = parser.parse_args(argv)
+
+    product_ids = read_product_ids(args.ids_file)
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    sink = ParquetSink(args.output) if fmt == "parquet" else CsvSink(args.output, args.encoding)
+
+    fetcher = Fetcher(
+        max_workers=args.concurrency,
+        per_host=args.concurrency,
+        min_interval=args.interval,
+        cache=None if args.no_cache else HttpCache(),
+    )
+    rows = queue.Queue(maxsize=QUEUE_SIZE)
+    # 書き込みに失敗したら立て、取得側が満杯のキューで待ち続けないようにする
+    stop = threading.Event()
+    total = 0
+    try:
+        # 取得はワーカースレッド、書き込みはこのスレッドだけで行う
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [
+                executor.submit(scrape_product, product_id, args.pages, fetcher, rows, not args.no_resume, stop)
+                for product_id in product_ids
+            ]
+            try:
+                remaining = len(product_ids)
+                batch = []
+                while remaining:
+                    row = rows.get()
+                    if row is _DONE:
+                        remaining -= 1
+                    else:
+                        batch.append(row)
+                    if len(batch) >= BATCH_SIZE or (batch and not remaining):
+                        write_batch(sink, batch)
+                        total += len(batch)
+                        batch = []
+            except BaseException:
+                # まだ始まっていない商品は取り消し、取得中のものは止めてキューを空にする
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                while not rows.empty():
+                    rows.get_nowait()
+                raise
+    finally:
+        sink.close()
+        fetcher.close()
+    print(f"合計 {total}件を {args.output} に書き出しました", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
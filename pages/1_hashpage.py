@@ -1,28 +1,174 @@
 import streamlit as st
-import hashlib
 import pandas as pd
+import os
+import tempfile
+import time
+from utils.hashing import ALGORITHMS, hash_columns, hash_csv_stream, restore_values
+from utils.hash_store import shared_store
+from utils.ingest import TABLE_TYPES, load_upload, upload_digest, upload_encoding
+from utils.export import download_section, header_encoding
+from utils.preview import show_preview
+
+@st.cache_resource(max_entries=2)
+def hash_upload(_df, digest, columns, algorithm, key, _store):
+    """選んだカラムをハッシュ化した表（同じファイル・カラム・方式・キーならプレビューを操作しても計算し直さない）"""
+    return hash_columns(_df, list(columns), algorithm, key, store=_store)
 
 ##タイトルに区切り線を引く
 st.header("csvデータをハッシュ化:sunglasses:", divider="orange")
 
-def hash_value(value):
-    """個々の値をSHA-256でハッシュ化する"""
-    # 数値やNaNを文字列に変換
-    value = str(value)
-    if pd.isna(value):
-        return value
-    return hashlib.sha256(value.encode()).hexdigest()
+# ハッシュ化の方式を選択
+algorithm_label = st.selectbox(
+    "ハッシュ化の方式",
+    list(ALGORITHMS),
+    help="SHA-256が従来と同じ方式です。BLAKE2bはより高速、HMAC-SHA256はキーを知らない人には元の値を推測できません"
+)
+algorithm = ALGORITHMS[algorithm_label]
+hmac_key = None
+if algorithm == "hmac-sha256":
+    hmac_key = st.text_input("HMACのキー", type="password", help="同じキーを使うと同じハッシュ値になります")
+
+# 処理モードを選択
+mode = st.radio(
+    "処理モード",
+    ["通常", "大容量ファイル（分割して処理）", "照合（ハッシュ値→元の値）"],
+    horizontal=True,
+    help="大容量ファイルでは、CSVを少しずつ読み込んでハッシュ化しながら書き出すので、処理中のメモリは増えません（プレビューは出ません）。"
+         "アップロードできるのは1GBまでで、アップロードしたファイルとダウンロードするファイルはサーバーのメモリに載ります。"
+         "照合では、ハッシュ化したCSVを元の値の一覧と突き合わせて元の値に戻します"
+)
+
+# ハッシュ値の保存（使い回し）を選択
+use_store = st.checkbox(
+    "ハッシュ値を保存して次回以降に使い回す",
+    help="一度ハッシュ化した値はこのサーバーのディスクに保存され、同じ値は次から計算せずに取り出します。"
+         "元の値もそのまま保存されるので、共有サーバーでは注意してください（HMACのキーは保存しません）"
+)
+store = shared_store() if use_store else None
+if store is not None:
+    with st.expander("保存しているハッシュ値"):
+        st.caption(f"{store.count():,}件を保存しています")
+        if st.button("🗑️ 保存したハッシュ値を削除"):
+            store.clear()
+            st.rerun()
+
+if mode == "照合（ハッシュ値→元の値）":
+    uploaded_file = st.file_uploader("ハッシュ化したファイルをアップロードしてください", type=TABLE_TYPES)
+elif mode == "大容量ファイル（分割して処理）":
+    uploaded_file = st.file_uploader(f"アップロードされたデータを{algorithm_label}でハッシュ化するよ", type=["csv"])
+else:
+    uploaded_file = st.file_uploader(f"アップロードされたデータを{algorithm_label}でハッシュ化するよ", type=TABLE_TYPES)
+
+# 大容量モードの出力を置くディレクトリと、残しておく時間（秒）
+STREAM_DIR = os.path.join(tempfile.gettempdir(), "matsurina_hash")
+STREAM_MAX_AGE = 6 * 60 * 60
+
+def remove_old_outputs():
+    """セッションが終わって残った古い出力ファイルを消す"""
+    os.makedirs(STREAM_DIR, exist_ok=True)
+    now = time.time()
+    for name in os.listdir(STREAM_DIR):
+        path = os.path.join(STREAM_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > STREAM_MAX_AGE:
+                os.remove(path)
+        except OSError:
+            pass
 
-uploaded_file = st.file_uploader("アップロードされたデータをSHA-256でハッシュ化するよ", type=["csv"])
+def stream_hash(uploaded_file, columns_to_hash, encoding, signature):
+    """CSVを分割して読みながらハッシュ化し、結果を一時ファイルに書き出す"""
+    # 前回の出力ファイルと、ほかのセッションが残した古いファイルは消しておく
+    old = st.session_state.pop("hashed_stream", None)
+    if old and os.path.exists(old["path"]):
+        os.remove(old["path"])
+    remove_old_outputs()
+    
+    with tempfile.NamedTemporaryFile(suffix=".csv", dir=STREAM_DIR, delete=False) as tmp:
+        path = tmp.name
+    progress_text = st.empty()
+    uploaded_file.seek(0)
+    rows = hash_csv_stream(
+        uploaded_file,
+        path,
+        columns_to_hash,
+        algorithm,
+        hmac_key,
+        encoding=encoding,
+        # 値はハッシュ値（ASCII）だけなので、見出しを表せる文字コードで書き出す
+        output_encoding=header_encoding(columns_to_hash),
+        on_chunk=lambda rows: progress_text.write(f"🔄 {rows:,}行を処理しました..."),
+        store=store,
+    )
+    progress_text.write(f"✅ {rows:,}行をハッシュ化しました")
+    st.session_state["hashed_stream"] = {"path": path, "signature": signature}
 
-if uploaded_file is not None:
+if uploaded_file is not None and mode == "大容量ファイル（分割して処理）":
+    try:
+        # 文字コードを判定し、見出し行だけ読んでカラムを選ばせる
+        encoding = upload_encoding(uploaded_file)
+        columns = pd.read_csv(uploaded_file, encoding=encoding, nrows=0).columns.tolist()
+        columns_to_hash = st.multiselect("ハッシュ化するカラムを選択してください", columns)
+        st.caption("大容量モードでは、値をCSVに書かれている文字列のままハッシュ化します（例：「007」は「7」に変換されません）")
+        
+        if columns_to_hash and algorithm == "hmac-sha256" and not hmac_key:
+            st.info("HMACのキーを入力してください")
+        elif columns_to_hash:
+            # ファイルや設定が変わったら前回の結果は使わない
+            signature = (uploaded_file.file_id, tuple(columns_to_hash), algorithm, hmac_key)
+            if st.button("🔒 ハッシュ化を実行"):
+                stream_hash(uploaded_file, columns_to_hash, encoding, signature)
+            
+            result = st.session_state.get("hashed_stream")
+            if result and result["signature"] == signature and os.path.exists(result["path"]):
+                with open(result["path"], "rb") as f:
+                    st.download_button(
+                        label="ハッシュ化したカラムをCSVでダウンロード",
+                        data=f,
+                        file_name='hashed_columns.csv',
+                        mime='text/csv',
+                    )
+        else:
+            st.info("ハッシュ化するカラムを選択してください")
+    
+    except Exception as e:
+        st.error(f"エラーが発生しました: {str(e)}")
+elif uploaded_file is not None and mode == "照合（ハッシュ値→元の値）":
+    try:
+        hashed_df = load_upload(uploaded_file)
+        master_file = st.file_uploader("元の値の一覧（マスタ）のファイルをアップロードしてください", type=TABLE_TYPES)
+        
+        if master_file is None:
+            st.info("元の値の一覧をアップロードしてください")
+        else:
+            master_df = load_upload(master_file)
+            hashed_column = st.selectbox("ハッシュ値のカラム", hashed_df.columns.tolist())
+            master_column = st.selectbox("元の値のカラム（マスタ側）", master_df.columns.tolist())
+            st.caption("ハッシュ化したときと同じ方式・キーを選んでください")
+            
+            if algorithm == "hmac-sha256" and not hmac_key:
+                st.info("HMACのキーを入力してください")
+            else:
+                # マスタをハッシュ化して索引を作り、ハッシュ値ごとに引く
+                restored = restore_values(hashed_df[hashed_column], master_df[master_column], algorithm, hmac_key, store=store)
+                result_df = hashed_df.copy()
+                result_df.insert(result_df.columns.get_loc(hashed_column) + 1, f"{hashed_column}_元の値", restored)
+                
+                matched = restored.notna().sum()
+                st.write(f"✅ {len(result_df):,}行中 {matched:,}行が一致しました")
+                show_preview(result_df, "restored")
+                
+                download_section(result_df, "restored_columns", "restored", label="照合結果をダウンロード")
+    
+    except Exception as e:
+        st.error(f"エラーが発生しました: {str(e)}")
+elif uploaded_file is not None:
     try:
-        # CSVファイルを読み込む
-        df = pd.read_csv(uploaded_file, encoding='shift-jis')
+        # ファイルを読み込む（文字コードは自動で判定し、同じファイルは再読み込みしない）
+        df = load_upload(uploaded_file)
         
         # オリジナルのデータを表示
         st.write("元のデータのプレビュー:")
-        st.data_editor(df)
+        show_preview(df, "original")
         
         # ハッシュ化するカラムを選択
         columns_to_hash = st.multiselect(
@@ -30,34 +176,28 @@ if uploaded_file is not None:
             df.columns.tolist()
         )
         
-        if columns_to_hash:  # カラムが選択されている場合
-            # 選択されたカラムのみをハッシュ化
-            hashed_df = df.copy()
-            for column in columns_to_hash:
-                hashed_df[column] = df[column].apply(hash_value)
+        if columns_to_hash and algorithm == "hmac-sha256" and not hmac_key:
+            st.info("HMACのキーを入力してください")
+        elif columns_to_hash:  # カラムが選択されている場合
+            # 選択されたカラムのみをハッシュ化（同じ値は1回だけ計算する）
+            hashed_df = hash_upload(df, upload_digest(uploaded_file), tuple(columns_to_hash), algorithm, hmac_key, store)
             
             # ハッシュ化したデータを表示
             st.write("ハッシュ化したデータはこちらです:")
-            st.data_editor(hashed_df)
+            show_preview(hashed_df, "hashed")
             
             # 選択されたカラムのみのデータフレームを作成
             selected_df = hashed_df[columns_to_hash]
             
-            # 選択されたカラムのみをCSVでダウンロード
-            csv = selected_df.to_csv(index=False).encode('shift-jis')
-            st.download_button(
-                label="ハッシュ化したカラムをCSVでダウンロード",
-                data=csv,
-                file_name='hashed_columns.csv',
-                mime='text/csv',
-            )
+            # 選択されたカラムのみをダウンロード（ボタンを押したときだけファイルを作る）
+            download_section(selected_df, "hashed_columns", "hashed", label="ハッシュ化したカラムをダウンロード")
         else:
             st.info("ハッシュ化するカラムを選択してください")
 
     except Exception as e:
         st.error(f"エラーが発生しました: {str(e)}")
 else:
-    st.write("ファイルをアップロードしてください。頭のセルはラベルにしてください")
+    st.write("ファイルをアップロードしてください（CSV・Excel・Parquet）。頭のセルはラベルにしてください")
 
 # フッター
 st.sidebar.markdown("---")
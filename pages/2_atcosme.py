@@ -1,8 +1,16 @@
 import streamlit as st
-import re
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+from utils.checkpoint import ScrapeCheckpoint, checkpoint_path
+from utils.cosme import iter_reviews, review_list_url, to_frame
+from utils.fetcher import Fetcher
+from utils.http_cache import shared_cache, format_stats
+from utils.export import download_section
+from utils.live_view import LiveResults
+from utils.preview import show_preview
+
+@st.cache_resource
+def get_fetcher(concurrency, min_interval):
+    """再実行をまたいで接続プールを使い回すためにFetcherをキャッシュする"""
+    return Fetcher(max_workers=concurrency, per_host=concurrency, min_interval=min_interval, cache=shared_cache())
 
 st.header("@cosmeスクレイピング 🔍", divider="orange")
 
@@ -14,11 +22,8 @@ product_id = st.text_input(
     help="@cosmeの商品ページURLから商品IDの数字部分のみを入力してください"
 )
 
-# URLの生成
-base_url = f"https://www.cosme.net/products/{product_id}/review/?page="
-
 # 生成されたURLを表示
-st.caption(f"スクレイピング対象のURL: {base_url}1")
+st.caption(f"スクレイピング対象のURL: {review_list_url(product_id, 1)}")
 
 # ページ数入力フォーム
 max_pages = st.number_input(
@@ -30,130 +35,107 @@ max_pages = st.number_input(
     help="取得したいページ数を入力してください（1以上の数値）"
 )
 
+# 取得速度の詳細設定
+with st.expander("⚙️ 詳細設定"):
+    concurrency = st.number_input(
+        "同時接続数",
+        min_value=1,
+        max_value=16,
+        value=8,
+        step=1,
+        help="レビュー詳細ページを同時に取得する数です。大きくしすぎると@cosme側に負荷がかかります"
+    )
+    min_interval = st.number_input(
+        "アクセス間隔（秒）",
+        min_value=0.0,
+        max_value=5.0,
+        value=0.2,
+        step=0.1,
+        help="同じサイトへのリクエストを開始する最小間隔です"
+    )
+
+# 途中経過の保存と再開
+resume = st.checkbox(
+    "前回の続きから再開する",
+    value=True,
+    help="ページごとに途中経過を保存します。同じ商品IDで再実行すると、取得済みのページやレビューは再取得しません"
+)
+if checkpoint_path("cosme", product_id).exists():
+    with ScrapeCheckpoint("cosme", product_id) as checkpoint:
+        saved_count = checkpoint.review_count()
+        if saved_count:
+            st.caption(f"💾 この商品の途中経過: {saved_count}件のレビューを保存済み")
+            if st.button("🗑️ 途中経過を削除して最初から取得する"):
+                checkpoint.clear()
+                st.rerun()
+
 # 実行ボタンを目立つように配置
 st.markdown("---")
 col1, col2, col3 = st.columns([1, 2, 1])
 with col2:
     start_button = st.button("🚀 スクレイピングを開始", use_container_width=True)
 
-##########
-results = []
-##########
-
 if start_button:
+    # 前回の結果は消しておく
+    st.session_state.pop("cosme_result", None)
+    
     # 実行状況を表示するコンテナ
     status_container = st.container()
     with status_container:
         st.markdown("### 実行状況")
-        progress_text = st.empty()
-        progress_bar = st.progress(0)
+        # 進捗と取得中のレビューはこの表示の中でまとめて更新する
+        live = LiveResults(total_pages=max_pages, columns=["score", "comment", "reviewer_info"])
+        
+        checkpoint = ScrapeCheckpoint("cosme", product_id)
+        if not resume:
+            checkpoint.clear()
         
         try:
-            # 処理開始メッセージ
-            st.info("🔄 スクレイピングを開始します...")
+            fetcher = get_fetcher(concurrency, min_interval)
             
-            # 指定されたページ数までループ
-            for i in range(1, max_pages + 1):
-                load_url = base_url + str(i)
-                
-                # URLアクセス状況を表示
-                progress_text.write(f"🌐 URL: {load_url} にアクセス中...")
-                
-                html = requests.get(load_url)
-                soup = BeautifulSoup(html.content,"html.parser")
-
-                review_count = 0
-                reviews = soup.select("span.read-more a.cmn-viewmore")
-                
-                # レビューが見つからない場合はループを終了
-                if not reviews:
-                    st.warning(f"⚠️ ページ {i} にレビューが見つかりませんでした。ここまでのデータを処理します。")
-                    break
-                
-                for element in reviews:
-                    review_url = element.get("href")
-                    
-                    #取り出したURLの口コミを取り出す
-                    review_html = requests.get(review_url)
-                    soup = BeautifulSoup(review_html.content,"html.parser")
-                    review_text = soup.select_one("p.read").get_text().strip()
-                    
-                    #スコア情報を取得
-                    if soup.select_one("div.rating.clearfix p.reviewer-rating"):
-                        score = soup.select_one("div.rating.clearfix p.reviewer-rating").extract().text
-                        matches = re.findall(r"[0-9]+", score)
-                        if matches:
-                            score = int(matches[0])
-                        else:
-                            score = None
-                    else:
-                        score = None
-
-                    # 年齢と肌タイプ情報を取得
-                    age = None
-                    skin_type = None
-                    # レビュアー情報を取得（年齢と肌タイプ）
-                    reviewer_info = soup.select_one("div.reviewer-info")
-                    if reviewer_info:
-                        info_text = reviewer_info.text.strip()
-                        
-                        # 具体的な年齢（例：32歳）を検索
-                        age_match = re.search(r'(\d+)歳', info_text)
-                        if age_match:
-                            age = age_match.group(0)  # "32歳" のように保存
-                        else:
-                            # 年代（例：40代前半）を検索
-                            age_range_match = re.search(r'(\d+代[前中後半]*)', info_text)
-                            if age_range_match:
-                                age = age_range_match.group(0)  # "40代前半" のように保存
-                        
-                        # 肌タイプを検索（例：乾燥肌、混合肌、普通肌など）
-                        skin_match = re.search(r'[/／]\s*([^/／\n]*肌)', info_text) or \
-                                   re.search(r'[\s/／]([^/／\s]*肌)', info_text) or \
-                                   re.search(r'([^/／\s]*肌)(?:\s|$)', info_text)
-                        if skin_match:
-                            skin_type = skin_match.group(1).strip()
-
-                    results.append({
-                        "score": score, 
-                        "age": age,
-                        "skin_type": skin_type,
-                        "comment": review_text
-                    })
-                    review_count += 1
-                    
-                # 進捗状況を更新
-                progress = int((i / max_pages) * 100)
-                progress_bar.progress(progress)
-                progress_text.write(f"✅ ページ {i}/{max_pages} の処理が完了 (進捗: {progress}%)")
-                st.write(f"📝 {review_count}件のレビューを取得しました")
+            def on_page(page, review_count):
+                """1ページ読み終えるたびに進捗を更新する"""
+                # レビューが見つからない場合はここまでのデータを処理する
+                if review_count is None:
+                    st.warning(f"⚠️ ページ {page} にレビューが見つかりませんでした。ここまでのデータを処理します。")
+                    return
+                live.page_done(page)
+            
+            for review in iter_reviews(product_id, max_pages, fetcher, on_page=on_page, checkpoint=checkpoint):
+                live.add(review)
+            live.flush()
                 
-            # データフレーム作成と表示
-            df = pd.DataFrame(results)
+            # 表示を切り替えても結果が消えないようにセッションに残す
+            st.session_state["cosme_result"] = {
+                "df": to_frame(live.rows),
+                "pages": live.pages,
+            }
             st.success("🎉 データの取得が完了しました！")
             
-            # 取得結果のサマリーを表示
-            st.markdown("### 取得結果サマリー")
-            st.write(f"- 実際に取得したページ数: {i}ページ")
-            st.write(f"- 総レビュー数: {len(results)}件")
-            
-            # データプレビュー
-            st.markdown("### データプレビュー")
-            st.data_editor(df)
-            
-            # CSVダウンロードボタン
-            st.markdown("### データのダウンロード")
-            csv = df.to_csv(index=False).encode('shift-jis')
-            st.download_button(
-                label="📥 データをCSVでダウンロード",
-                data=csv,
-                file_name='cosme_reviews.csv',
-                mime='text/csv',
-            )
-            
         except Exception as e:
             st.error(f"⚠️ エラーが発生しました: {str(e)}")
-else:
+            st.info(f"💾 完了したページまでの{checkpoint.review_count()}件は保存済みです。もう一度実行すると続きから再開します。")
+        finally:
+            checkpoint.close()
+
+result = st.session_state.get("cosme_result")
+if result:
+    df = result["df"]
+    
+    # 取得結果のサマリーを表示
+    st.markdown("### 取得結果サマリー")
+    st.write(f"- 実際に取得したページ数: {result['pages']}ページ")
+    st.write(f"- 総レビュー数: {len(df)}件")
+    st.caption(format_stats(shared_cache()))
+    
+    # データプレビュー
+    st.markdown("### データプレビュー")
+    show_preview(df, "cosme")
+    
+    # ダウンロード（ボタンを押したときだけファイルを作る）
+    st.markdown("### データのダウンロード")
+    download_section(df, "cosme_reviews", "cosme")
+elif not start_button:
     st.info("👆 上のボタンをクリックしてスクレイピングを開始してください")
 
 # 使い方の説明を上部に移動
@@ -174,7 +156,7 @@ with st.expander("💡 使い方"):
     3. 「スクレイピングを開始」ボタンをクリック
     4. データ取得が完了するまで待機
     5. 取得したデータを確認
-    6. 必要に応じてCSVファイルをダウンロード
+    6. 必要に応じてファイル（CSV・Excel・Parquet）をダウンロード
     """)
 
 # フッター
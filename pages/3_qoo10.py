@@ -1,59 +1,51 @@
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
 import pandas as pd
-import time
+from utils.export import download_section
+from utils.fetcher import Fetcher
+from utils.http_cache import shared_cache, format_stats
+from utils.live_view import LiveResults
+from utils.qoo10 import iter_review_pages
+
+# ヘッダーを設定してブロックを回避
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# 同時に取得するページ数と、平均のアクセス間隔（秒）。429や5xxが返ると自動で間隔を広げる
+CONCURRENCY = 4
+MIN_INTERVAL = 0.5
+
+@st.cache_resource
+def get_fetcher():
+    """再実行をまたいで接続とキャッシュを使い回す"""
+    return Fetcher(
+        max_workers=CONCURRENCY,
+        per_host=CONCURRENCY,
+        min_interval=MIN_INTERVAL,
+        burst=CONCURRENCY,
+        headers=HEADERS,
+        cache=shared_cache(),
+    )
 
 def get_reviews(base_url, max_pages=None):
-    """Qoo10の全ページまたは指定ページ数までのレビューを取得する関数"""
-    all_reviews = []
-    page = 1
+    """Qoo10の全ページまたは指定ページ数までのレビューを取得する関数
+
+    取得しながら1つの表と進捗表示を更新する。
+    """
+    live = LiveResults(total_pages=max_pages, columns=['レビュー'])
     
     try:
-        while True:
-            # 指定ページ数に達したら終了
-            if max_pages and page > max_pages:
-                break
-                
-            # ヘッダーを設定してブロックを回避
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            # URLにページ番号を追加
-            url = f"{base_url}#customerReview?page={page}"
-            response = requests.get(url, headers=headers)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # レビューテキストを取得
-            review_elements = soup.find_all('p', class_='review_txt')
-            
-            # レビューが見つからない場合は終了
-            if not review_elements:
-                break
-                
+        for page, review_texts in iter_review_pages(base_url, get_fetcher(), max_pages, window=CONCURRENCY):
             # レビューを追加
-            for review in review_elements:
-                all_reviews.append(review.text.strip())
-            
-            # ページング情報を取得
-            paging = soup.find('div', id='pagingQA')
-            if not paging:
-                break
-                
-            # 進捗状況を表示
-            st.write(f"ページ {page} を取得中...")
-            
-            # サーバーに負荷をかけないよう少し待機
-            time.sleep(2)
-            
-            page += 1
-            
-        return all_reviews
+            live.extend({'レビュー': text} for text in review_texts)
+            live.page_done(page)
+        live.flush()
+        return [row['レビュー'] for row in live.rows]
         
     except Exception as e:
+        live.flush()
         st.error(f"エラーが発生しました: {e}")
-        return all_reviews  # エラーが発生しても、それまでに取得したレビューは返す
+        return [row['レビュー'] for row in live.rows]  # エラーが発生しても、それまでに取得したレビューは返す
 
 def main():
     st.title("Qoo10レビュー取得")
@@ -75,25 +67,21 @@ def main():
     if st.button("レビューを取得"):
         with st.spinner("レビューを取得中..."):
             reviews = get_reviews(url, max_pages)
-            
-            if reviews:
-                # レビュー数を表示
-                st.success(f"{len(reviews)}件のレビューを取得しました！")
-                
-                # レビューを表示
-                with st.expander("レビュー一覧"):
-                    for i, review in enumerate(reviews, 1):
-                        st.write(f"{i}. {review}")
-                
-                # CSVダウンロードボタン
-                df = pd.DataFrame(reviews, columns=['レビュー'])
-                csv = df.to_csv(index=False).encode('utf-8-sig')
-                st.download_button(
-                    label="CSVでダウンロード",
-                    data=csv,
-                    file_name="qoo10_reviews.csv",
-                    mime="text/csv"
-                )
+            # 表示を切り替えても結果が消えないようにセッションに残す
+            st.session_state["qoo10_result"] = pd.DataFrame(reviews, columns=['レビュー'])
+    
+    df = st.session_state.get("qoo10_result")
+    if df is not None and len(df):
+        # レビュー数を表示
+        st.success(f"{len(df)}件のレビューを取得しました！")
+        st.caption(format_stats(shared_cache()))
+        
+        # レビューを表示
+        with st.expander("レビュー一覧"):
+            st.dataframe(df, use_container_width=True)
+        
+        # ダウンロード（ボタンを押したときだけファイルを作る）
+        download_section(df, "qoo10_reviews", "qoo10", label="ダウンロード", encodings=("utf-8-sig",))
 
 if __name__ == "__main__":
     main()
@@ -1,183 +1,241 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from collections import Counter
-import re
-from wordcloud import WordCloud
-import MeCab
-import tempfile
-import os
-from pathlib import Path
 import matplotlib.font_manager as fm
-from io import BytesIO
+from utils.cooccurrence import cooccurrence, network_dot, ngrams
+from utils.ingest import TABLE_TYPES, load_upload, upload_digest, upload_encoding
+from utils.segments import MAX_SEGMENTS, limit_segments, segment_labels, segment_term_matrix, top_terms_by_segment
+from utils.text_stream import RunningCounts, iter_text_chunks
+from utils.tokens import cached_token_table, count_terms, token_pool
+from utils.wordcloud_image import get_font_path, render_png
 
-def get_font_path():
-    """利用可能なフォントパスを取得"""
-    # IPAフォントを優先的に使用（日本語対応）
-    ipa_paths = [
-        "/usr/share/fonts/opentype/ipafont-gothic/ipag.ttf",
-        "/usr/share/fonts/truetype/ipafont/ipag.ttf",
-        "/usr/share/fonts/truetype/ipafont-gothic/ipag.ttf"
-    ]
-    
-    for path in ipa_paths:
-        if os.path.exists(path):
-            return path
-    
-    # Notoフォントを試す
-    noto_paths = [
-        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
-        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-        "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc"
-    ]
-    
-    for path in noto_paths:
-        if os.path.exists(path):
-            return path
-    
-    # システムにインストールされているフォントを探す
-    fonts = fm.findSystemFonts()
-    
-    # 日本語フォントを優先的に探す
-    for font in fonts:
-        try:
-            if any(name in font.lower() for name in ['ipa', 'noto', 'gothic', 'mincho']):
-                return font
-        except:
-            continue
+# ワードクラウドに出す単語の数
+MAX_WORDS = 100
+
+# グループごとの比べ方（画面に出す名前: segments.top_terms_by_segment の method）
+SEGMENT_METHODS = {
+    "特徴語（ログオッズ比）": "log_odds",
+    "特徴語（TF-IDF）": "tfidf",
+    "出現回数": "count",
+}
+
+def top_words_frame(word_counts, n=20):
+    """出現回数の多い単語の表"""
+    return pd.DataFrame({'単語': word_counts.index[:n], '出現回数': word_counts.values[:n]})
+
+def top_pairs_frame(pair_counts, n=20):
+    """一緒に出てくる文書数の多い単語の組み合わせの表"""
+    return pair_counts.head(n).rename("文書数").reset_index()
+
+def choose_words():
+    """抽出する品詞と単語の形を選ばせる"""
+    # 品詞選択
+    pos_options = ["名詞", "動詞", "形容詞", "副詞"]
+    selected_pos = st.multiselect(
+        "抽出する品詞を選択してください",
+        pos_options,
+        default=["名詞"]
+    )
     
-    return None
+    # 単語の形を選択
+    field = st.radio(
+        "単語の形",
+        ["surface", "lemma"],
+        format_func=lambda name: {"surface": "文中の形（表層形）", "lemma": "原形（「良かっ」→「良い」）"}[name],
+        horizontal=True
+    )
+    return selected_pos, field
 
-# フォントの設定
-plt.rcParams['font.family'] = ['IPAGothic', 'Noto Sans CJK JP']
-plt.rcParams['font.sans-serif'] = ['Noto Sans CJK JP', 'IPAGothic', 'Hiragino Sans']
+def relation_settings():
+    """共起・n-gramの絞り込み条件を選ばせる"""
+    col1, col2 = st.columns(2)
+    min_support = col1.number_input(
+        "最低出現数",
+        min_value=1,
+        value=5,
+        step=1,
+        help="一緒に出てくる文書数（n-gramは出現回数）がこれより少ない組み合わせは表示しません"
+    )
+    top_k = col2.number_input("表示する組み合わせの数", min_value=5, max_value=200, value=30, step=5)
+    return min_support, top_k
 
-# MeCabの初期化をシンプルに
-tagger = MeCab.Tagger()
+def show_network(pairs, word_counts):
+    """共起ネットワークと共起の表を表示する"""
+    st.subheader("共起ネットワーク")
+    if pairs.empty:
+        st.info("条件に合う組み合わせがありませんでした。最低出現数を下げてみてください")
+        return
+    st.graphviz_chart(network_dot(pairs, word_counts))
+    st.dataframe(top_pairs_frame(pairs, len(pairs)), use_container_width=True)
+
+def show_wordcloud(word_counts):
+    """単語の出現回数からワードクラウドと頻出単語の表を表示する"""
+    with st.spinner("ワードクラウドを生成中..."):
+        try:
+            # 出現回数の多い単語から描く（同じ回数・同じ設定ならキャッシュした画像を使う）
+            frequencies = tuple(word_counts.head(MAX_WORDS).items())
+            png = render_png(frequencies, max_words=MAX_WORDS)
+            st.caption(f"使用フォント: {get_font_path()}")
+            st.image(png, use_container_width=True)
+            
+            # 頻出単語の表示
+            st.subheader("頻出単語TOP20（表）")
+            st.dataframe(top_words_frame(word_counts), use_container_width=True)
+            
+            # ダウンロードボタン
+            st.download_button(
+                label="📥 ワードクラウド画像をダウンロード",
+                data=png,
+                file_name="wordcloud.png",
+                mime="image/png"
+            )
+
+        except Exception as e:
+            st.error(f"ワードクラウドの生成中にエラーが発生しました: {str(e)}")
+            st.error("フォントパスを確認中...")
+            
+            try:
+                # システムフォントの一覧を表示（デバッグ用）
+                available_fonts = [f for f in fm.findSystemFonts()]
+                st.write("利用可能なフォント:", available_fonts[:5])  # 最初の5つだけ表示
+                
+            except Exception as e:
+                st.error(f"フォント情報の取得に失敗: {str(e)}")
 
 st.header("テキスト分析 📊", divider="rainbow")
 
+# 処理モードを選択
+mode = st.radio(
+    "処理モード",
+    ["通常", "大容量ファイル（分割して処理）"],
+    horizontal=True,
+    help="大容量ファイルでは、CSVを少しずつ読み込んで解析しながら単語を数えるので、全体を読み込めないファイルも分析できます。"
+         "途中経過として、その時点の頻出単語を表示します"
+)
+
 # ファイルアップロード
-uploaded_file = st.file_uploader("CSVファイルをアップロードしてください", type=["csv"])
+if mode == "大容量ファイル（分割して処理）":
+    uploaded_file = st.file_uploader("CSVファイルをアップロードしてください", type=["csv"])
+else:
+    uploaded_file = st.file_uploader("CSV・Excel・Parquetファイルをアップロードしてください", type=TABLE_TYPES)
 
-if uploaded_file is not None:
+if uploaded_file is not None and mode == "大容量ファイル（分割して処理）":
     try:
-        # CSVファイルを読み込む（複数のエンコーディングを試す）
-        try:
-            # まずUTF-8で試す
-            df = pd.read_csv(uploaded_file, encoding='utf-8')
-        except UnicodeDecodeError:
-            try:
-                # 次にShift-JISで試す
-                uploaded_file.seek(0)  # ファイルポインタを先頭に戻す
-                df = pd.read_csv(uploaded_file, encoding='shift-jis')
-            except UnicodeDecodeError:
-                # 最後にCP932で試す
-                uploaded_file.seek(0)  # ファイルポインタを先頭に戻す
-                df = pd.read_csv(uploaded_file, encoding='cp932')
+        # 文字コードを判定し、見出し行だけ読んでカラムを選ばせる
+        encoding = upload_encoding(uploaded_file)
+        columns = pd.read_csv(uploaded_file, encoding=encoding, nrows=0).columns.tolist()
+        text_column = st.selectbox(
+            "分析するカラムを選択してください※テキストのあるカラムにしてください",
+            columns
+        )
+        selected_pos, field = choose_words()
+        
+        # ファイルや設定が変わったら前回の結果は使わない
+        signature = (upload_digest(uploaded_file), text_column, tuple(selected_pos), field)
+        if st.button("▶️ 分析を開始"):
+            st.session_state.pop("textmining_stream", None)
+            counts = RunningCounts(selected_pos, field)
+            status = st.empty()
+            col1, col2 = st.columns(2)
+            live_words = col1.empty()
+            live_pairs = col2.empty()
+            
+            # チャンクを解析するたびに、その時点の頻出単語を表示する
+            # 解析用のプロセスはストリーム全体で1回だけ起動する
+            uploaded_file.seek(0)
+            with token_pool() as pool:
+                for texts in iter_text_chunks(uploaded_file, text_column, encoding):
+                    counts.add(texts, pool=pool)
+                    status.write(f"🔄 {counts.rows:,}行を処理しました...")
+                    live_words.dataframe(top_words_frame(counts.top_terms(20)))
+                    live_pairs.dataframe(top_pairs_frame(counts.top_pairs(20)))
+            status.write(f"✅ {counts.rows:,}行を分析しました")
+            live_words.empty()
+            live_pairs.empty()
+            st.session_state["textmining_stream"] = {"signature": signature, "counts": counts}
+        
+        result = st.session_state.get("textmining_stream")
+        if result and result["signature"] == signature:
+            counts = result["counts"]
+            word_counts = counts.top_terms()
+            
+            # 共起の表示
+            min_support, top_k = relation_settings()
+            pairs = counts.top_pairs()
+            show_network(pairs[pairs >= min_support].head(top_k), word_counts)
+            
+            # ワードクラウド生成ボタン
+            if word_counts.empty:
+                st.info("選択した品詞の単語が見つかりませんでした。カラムや品詞を変えてみてください")
+            elif st.button("🎨 ワードクラウドを生成"):
+                show_wordcloud(word_counts)
+                
+    except Exception as e:
+        st.error(f"エラーが発生しました: {str(e)}")
+elif uploaded_file is not None:
+    try:
+        # ファイルを読み込む（文字コードは先頭から判定して1回だけ解析する）
+        df = load_upload(uploaded_file)
         
         # カラム選択
         text_column = st.selectbox(
             "分析するカラムを選択してください※テキストのあるカラムにしてください",
             df.columns.tolist()
         )
+        selected_pos, field = choose_words()
         
-        # 品詞選択
-        pos_options = ["名詞", "動詞", "形容詞", "副詞"]
-        selected_pos = st.multiselect(
-            "抽出する品詞を選択してください",
-            pos_options,
-            default=["名詞"]
+        # カラムごとに1回だけ形態素解析する（品詞や単語の形を変えても解析し直さない）
+        # 件数が多いときは複数プロセスで解析し、進み具合を表示する
+        progress = st.empty()
+        tokens = cached_token_table(
+            df[text_column],
+            (upload_digest(uploaded_file), text_column),
+            on_progress=lambda done, total: progress.progress(done / total, text=f"形態素解析中... {done:,}/{total:,}件"),
         )
+        progress.empty()
         
-        # テキストデータの前処理
-        def process_text(text):
-            # 単語と品詞の抽出
-            words = []
-            node = tagger.parseToNode(str(text))
-            
-            while node:
-                # 品詞を取得
-                pos = node.feature.split(',')[0]
-                
-                # 選択された品詞のみを抽出
-                if pos in selected_pos:
-                    word = node.surface
-                    # 空でなく、1文字以上の単語を追加
-                    if word and len(word) > 1:
-                        words.append(word)
-                node = node.next
-                
-            return words
-        
-        # 全テキストを結合して前処理
-        all_words = []
-        for text in df[text_column]:
-            if pd.notna(text):
-                all_words.extend(process_text(text))
+        # 選択された品詞の2文字以上の単語の出現回数（ワードクラウドと表で同じものを使う）
+        word_counts = count_terms(tokens, selected_pos, field)
         
         # ワードクラウド生成ボタン
-        if st.button("🎨 ワードクラウドを生成"):
-            with st.spinner("ワードクラウドを生成中..."):
-                try:
-                    # フォントパスの取得
-                    font_path = get_font_path()
-                    st.write(f"使用フォント: {font_path}")  # デバッグ用
-                    
-                    # ワードクラウドの生成
-                    wordcloud = WordCloud(
-                        font_path=font_path,
-                        background_color="white",
-                        width=800,
-                        height=600,
-                        regexp=r"[\w']+",
-                        collocations=False,
-                        min_font_size=10,
-                        max_words=100,
-                        prefer_horizontal=0.7,  # 横書きの比率を調整
-                        font_step=1,  # フォントサイズの調整ステップを小さくする
-                        normalize_plurals=False,  # 複数形の正規化を無効化
-                        repeat=True  # 単語の繰り返しを許可
-                    ).generate(" ".join(all_words))  # 単語リストを直接使用
-                    
-                    # プロットの作成
-                    fig, ax = plt.subplots(figsize=(10, 8))
-                    ax.imshow(wordcloud, interpolation='bilinear')
-                    ax.axis('off')
-                    
-                    # Streamlitでプロット表示
-                    st.pyplot(fig)
-                    
-                    # 頻出単語の表示
-                    word_freq = Counter(all_words).most_common(20)
-                    st.subheader("頻出単語TOP20（表）")
-                    freq_df = pd.DataFrame(word_freq, columns=['単語', '出現回数'])
-                    st.dataframe(freq_df, use_container_width=True)
-                    
-                    # メモリ上でバイナリデータとして画像を保存
-                    buf = BytesIO()
-                    plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0, dpi=300)  # DPIを上げる
-                    buf.seek(0)
-                    
-                    # ダウンロードボタン
-                    btn = st.download_button(
-                        label="📥 ワードクラウド画像をダウンロード",
-                        data=buf,
-                        file_name="wordcloud.png",
-                        mime="image/png"
-                    )
-
-                except Exception as e:
-                    st.error(f"ワードクラウドの生成中にエラーが発生しました: {str(e)}")
-                    st.error("フォントパスを確認中...")
-                    
-                    try:
-                        # システムフォントの一覧を表示（デバッグ用）
-                        available_fonts = [f for f in fm.findSystemFonts()]
-                        st.write("利用可能なフォント:", available_fonts[:5])  # 最初の5つだけ表示
-                        
-                    except Exception as e:
-                        st.error(f"フォント情報の取得に失敗: {str(e)}")
+        if word_counts.empty:
+            st.info("選択した品詞の単語が見つかりませんでした。カラムや品詞を変えてみてください")
+        elif st.button("🎨 ワードクラウドを生成"):
+            show_wordcloud(word_counts)
+        
+        # 共起とn-gram（形態素解析の結果から疎行列で数える）
+        if not word_counts.empty and st.checkbox("🔗 共起ネットワークとn-gramを表示"):
+            min_support, top_k = relation_settings()
+            show_network(cooccurrence(tokens, selected_pos, field, min_support=min_support, top_k=top_k), word_counts)
+            
+            n = st.radio("n-gramの語数", [2, 3], horizontal=True)
+            st.subheader(f"{n}-gram（続けて出てくる{n}語）")
+            grams = ngrams(tokens, n, selected_pos, field, min_support=min_support, top_k=top_k)
+            st.dataframe(grams.rename("出現回数").rename_axis("単語の並び").reset_index(), use_container_width=True)
+        
+        # グループごとの比較（形態素解析の結果をグループ×単語の疎行列にまとめ、全グループを一度に計算する）
+        other_columns = [column for column in df.columns if column != text_column]
+        if not word_counts.empty and other_columns and st.checkbox("👥 グループごとに比較（評価・年代・肌タイプなど）"):
+            preferred = [column for column in ["score", "age", "skin_type", "gender"] if column in other_columns]
+            segment_column = st.selectbox(
+                "グループ分けに使うカラム",
+                other_columns,
+                index=other_columns.index(preferred[0]) if preferred else 0,
+                help="年齢・年代は「○○代」に、種類の多い数値は4つの範囲にまとめます"
+            )
+            col1, col2 = st.columns(2)
+            method_label = col1.radio("比べ方", list(SEGMENT_METHODS))
+            segment_top_k = col2.number_input("グループごとに表示する単語の数", min_value=5, max_value=50, value=15, step=5)
+            
+            labels = segment_labels(df[segment_column])
+            if labels.nunique() > MAX_SEGMENTS:
+                st.caption(f"グループが多いため、件数の多い{MAX_SEGMENTS}グループだけを比べます")
+                labels = limit_segments(labels)
+            matrix, segments, terms, doc_counts = segment_term_matrix(tokens, labels, selected_pos, field)
+            st.caption(" / ".join(f"{segment}: {count:,}件" for segment, count in zip(segments, doc_counts)))
+            st.dataframe(
+                top_terms_by_segment(matrix, segments, terms, SEGMENT_METHODS[method_label], segment_top_k),
+                use_container_width=True
+            )
                 
     except Exception as e:
         st.error(f"エラーが発生しました: {str(e)}")
@@ -185,12 +243,14 @@ if uploaded_file is not None:
 # 使い方の説明
 with st.expander("💡 使い方"):
     st.write("""
-    1. 分析したいテキストデータを含むCSVファイルをアップロード
+    1. 分析したいテキストデータを含むファイル（CSV・Excel・Parquet）をアップロード
     2. 分析するカラムを選択
     3. 抽出したい品詞を選択
     4. 「ワードクラウドを生成」ボタンをクリック
     5. 生成されたワードクラウドと頻出単語を確認
     6. 必要に応じて画像をダウンロード
+    7. 「共起ネットワークとn-gramを表示」で、よく一緒に使われる単語や続けて出てくる単語を確認
+    8. 「グループごとに比較」で、評価・年代・肌タイプなどのグループごとの特徴的な単語を確認
     """)
 
 # フッター
@@ -1,6 +1,13 @@
 import streamlit as st
-import openai
-import pandas as pd  # pandasをインポートしてExcelやCSVを処理
+from utils.article_view import run_check
+from utils.ingest import load_upload, upload_digest
+from utils.rule_index import RuleIndex
+
+
+@st.cache_resource(max_entries=8)
+def load_rules(_df, digest):
+    """レギュレーションの表から語句の索引を作る（同じファイルなら作り直さない）"""
+    return RuleIndex(_df)
 
 
 # ページタイトル
@@ -11,42 +18,21 @@ regulation_file = st.file_uploader("レギュレーションファイルをア
 
 # URL入力フォーム
 url = st.text_input("テキストを抽出したい記事のURLを入力してください:")
+screen = st.checkbox("レギュレーションの語句が見つかった箇所だけをチェックする", value=True,
+                     help="語句・正規表現のないルールは、いつも本文全体と照らし合わせます")
+skip_clean = st.checkbox("語句が1つも見つからなければモデルを呼ばずに終える", value=False, disabled=not screen,
+                         help="APIの利用を減らせますが、語句のないルールや言い換えた表現はチェックしません")
 
 if st.button("チェック"):
     if regulation_file and url:
         try:
-            # アップロードされたレギュレーションファイルの内容を読み込む
-            if regulation_file.name.endswith('.xlsx'):
-                regulation_text = pd.read_excel(regulation_file).to_string(index=False)  # Excelファイルを読み込む
-            else:
-                regulation_text = pd.read_csv(regulation_file).to_string(index=False)  # CSVファイルを読み込む
-
-            # OpenAI APIを使用してレギュレーションと記事を比較
-            prompt = f"""
-            以下のレギュレーションに基づいて、指定されたURLの内容がレギュレーションに抵触するかどうかを判断してください。
-
-            ## レギュレーション
-            {regulation_text}
-
-            ## 記事URL
-            {url}
-
-            ## 指示
-            記事がレギュレーションに抵触する場合は、その部分を指摘してください。
-            """
-            completion = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",  # または "gpt-4" を使用
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-
-            # 抽出したテキストを表示
-            result_text = completion.choices[0].message['content']
-            st.subheader("チェック結果:")
-            st.text_area("結果", result_text, height=300)
+            # アップロードされたレギュレーションファイルの内容を読み込む（文字コードは自動で判定する）
+            rules = load_rules(load_upload(regulation_file), upload_digest(regulation_file))
+
+            # 記事の本文を取得し、語句で絞り込んでからレギュレーションと比較する
+            run_check(url, rules, screen, skip_clean)
 
         except Exception as e:
-            st.error(f"OpenAI APIエラー: {str(e)}")
+            st.error(f"エラーが発生しました: {str(e)}")
     else:
         st.warning("レギュレーションファイルと記事URLの両方を入力してください。")
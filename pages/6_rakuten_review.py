@@ -1,12 +1,24 @@
 import streamlit as st
-import re
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import time
+from utils.browser import DriverPool
+from utils.fetcher import Fetcher
+from utils.http_cache import shared_cache, format_stats
+from utils.export import download_section
+from utils.live_view import LiveResults
+from utils.preview import show_preview
+from utils.rakuten import HEADERS, iter_review_pages, review_page_url, to_frame
+
+# 全セッションで共有するブラウザの数（1回の取得で使う数は「同時に使うブラウザの数」で絞る）
+MAX_BROWSERS = 4
+
+@st.cache_resource
+def get_driver_pool():
+    """再実行をまたいでChromeを起動したまま使い回す（全セッションで1つ。大きさは変えない）"""
+    return DriverPool(size=MAX_BROWSERS)
+
+@st.cache_resource
+def get_fetcher():
+    """ブラウザを使わずに取得するときのHTTPクライアント"""
+    return Fetcher(max_workers=4, per_host=4, min_interval=0.5, headers=HEADERS, cache=shared_cache())
 
 st.header("楽天市場レビュースクレイピング 🔍※準備中", divider="orange")
 
@@ -18,11 +30,8 @@ product_id = st.text_input(
     help="楽天市場の商品レビューページURLから商品IDを入力してください"
 )
 
-# URLの生成
-base_url = f"https://review.rakuten.co.jp/item/1/{product_id}?p="
-
 # 生成されたURLを表示
-st.caption(f"スクレイピング対象のURL: {base_url}1")
+st.caption(f"スクレイピング対象のURL: {review_page_url(product_id, 1)}")
 
 # ページ数入力フォーム
 max_pages = st.number_input(
@@ -34,143 +43,85 @@ max_pages = st.number_input(
     help="取得したいページ数を入力してください（1以上の数値）"
 )
 
+# 取得方法の詳細設定
+with st.expander("⚙️ 詳細設定"):
+    browsers = st.number_input(
+        "同時に使うブラウザの数",
+        min_value=1,
+        max_value=MAX_BROWSERS,
+        value=2,
+        step=1,
+        help="ページを複数のブラウザに振り分けて並列に取得します。増やすほどメモリを使います"
+    )
+    use_http = st.checkbox(
+        "まずはブラウザを使わずに取得する（高速）",
+        value=True,
+        help="HTMLに含まれるレビューを直接読み、読めなかったページだけブラウザで取得します"
+    )
+
 # 実行ボタンを目立つように配置
 st.markdown("---")
 col1, col2, col3 = st.columns([1, 2, 1])
 with col2:
     start_button = st.button("🚀 スクレイピングを開始", use_container_width=True)
 
-##########
-results = []
-##########
-
 if start_button:
+    # 前回の結果は消しておく
+    st.session_state.pop("rakuten_result", None)
+    
     # 実行状況を表示するコンテナ
     status_container = st.container()
     with status_container:
         st.markdown("### 実行状況")
-        progress_text = st.empty()
-        progress_bar = st.progress(0)
+        # 進捗と取得中のレビューはこの表示の中でまとめて更新する
+        live = LiveResults(total_pages=max_pages, columns=["score", "comment", "reviewer_info"])
         
         try:
-            # 処理開始メッセージ
-            st.info("🔄 スクレイピングを開始します...")
-            
-            # Chromeドライバーの設定
-            chrome_options = Options()
-            chrome_options.add_argument('--headless')  # ヘッドレスモードで実行
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            
-            driver = webdriver.Chrome(options=chrome_options)
-            wait = WebDriverWait(driver, 10)
-            
-            # 指定されたページ数までループ
-            for i in range(1, max_pages + 1):
-                load_url = base_url + str(i)
-                
-                # URLアクセス状況を表示
-                progress_text.write(f"🌐 URL: {load_url} にアクセス中...")
-                
-                driver.get(load_url)
-                time.sleep(3)  # ページの読み込みを待つ
-                
-                # レビュー要素が表示されるまで待機
-                try:
-                    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div[class*='review-detail']")))
-                except:
-                    st.warning(f"⚠️ ページ {i} にレビューが見つかりませんでした。ここまでのデータを処理します。")
+            browser_pages = 0
+            # 同時に借りるブラウザは workers 個まで（プールの大きさは他のセッションと共有なので変えない）
+            for page, rows, method in iter_review_pages(
+                product_id, max_pages, get_fetcher(), get_driver_pool(), workers=browsers, use_http=use_http
+            ):
+                # レビューが見つからない場合はここまでのデータを処理する
+                if not rows:
+                    st.warning(f"⚠️ ページ {page} にレビューが見つかりませんでした。ここまでのデータを処理します。")
                     break
-                
-                # レビューを取得
-                reviews = driver.find_elements(By.CSS_SELECTOR, "div[class*='review-detail']")
-                review_count = 0
-                
-                for review in reviews:
-                    # レビュー本文を取得
-                    try:
-                        review_text = review.find_element(By.CSS_SELECTOR, "div[class*='review-body']").text.strip()
-                    except:
-                        continue
-                    
-                    # 評価を取得
-                    score = None
-                    try:
-                        score_element = review.find_element(By.CSS_SELECTOR, "div[class*='review-rating'] span")
-                        score_text = score_element.text.strip()
-                        score_match = re.search(r'(\d+)', score_text)
-                        if score_match:
-                            score = int(score_match.group(1))
-                    except:
-                        pass
-                    
-                    # レビュアー情報を取得
-                    age = None
-                    gender = None
-                    try:
-                        reviewer_info = review.find_element(By.CSS_SELECTOR, "div[class*='reviewer-info']")
-                        info_text = reviewer_info.text
-                        
-                        # 年齢を取得
-                        age_match = re.search(r'(\d+)代', info_text)
-                        if age_match:
-                            age = f"{age_match.group(1)}代"
-                            if "前半" in info_text:
-                                age += "前半"
-                            elif "後半" in info_text:
-                                age += "後半"
-                        
-                        # 性別を取得
-                        if "女性" in info_text:
-                            gender = "女性"
-                        elif "男性" in info_text:
-                            gender = "男性"
-                    except:
-                        pass
-                    
-                    results.append({
-                        "score": score,
-                        "age": age,
-                        "gender": gender,
-                        "comment": review_text
-                    })
-                    review_count += 1
-                
-                # 進捗状況を更新
-                progress = int((i / max_pages) * 100)
-                progress_bar.progress(progress)
-                progress_text.write(f"✅ ページ {i}/{max_pages} の処理が完了 (進捗: {progress}%)")
-                st.write(f"📝 {review_count}件のレビューを取得しました")
-            
-            # ブラウザを閉じる
-            driver.quit()
+                live.extend(rows)
+                live.page_done(page)
+                if method == "browser":
+                    browser_pages += 1
+            live.flush()
 
-            # データフレーム作成と表示
-            df = pd.DataFrame(results)
+            # 表示を切り替えても結果が消えないようにセッションに残す
+            st.session_state["rakuten_result"] = {
+                "df": to_frame(live.rows),
+                "pages": live.pages,
+                "browser_pages": browser_pages,
+            }
             st.success("🎉 データの取得が完了しました！")
             
-            # 取得結果のサマリーを表示
-            st.markdown("### 取得結果サマリー")
-            st.write(f"- 実際に取得したページ数: {i}ページ")
-            st.write(f"- 総レビュー数: {len(results)}件")
-            
-            # データプレビュー
-            st.markdown("### データプレビュー")
-            st.data_editor(df)
-            
-            # CSVダウンロードボタン
-            st.markdown("### データのダウンロード")
-            csv = df.to_csv(index=False).encode('shift-jis')
-            st.download_button(
-                label="📥 データをCSVでダウンロード",
-                data=csv,
-                file_name='rakuten_reviews.csv',
-                mime='text/csv',
-            )
-            
         except Exception as e:
             st.error(f"⚠️ エラーが発生しました: {str(e)}")
-else:
+
+result = st.session_state.get("rakuten_result")
+if result:
+    df = result["df"]
+    
+    # 取得結果のサマリーを表示
+    st.markdown("### 取得結果サマリー")
+    st.write(f"- 実際に取得したページ数: {result['pages']}ページ")
+    st.write(f"- 総レビュー数: {len(df)}件")
+    st.write(f"- ブラウザで取得したページ数: {result['browser_pages']}ページ")
+    st.caption(format_stats(shared_cache()))
+    
+    # データプレビュー
+    st.markdown("### データプレビュー")
+    show_preview(df, "rakuten")
+    
+    # ダウンロード（ボタンを押したときだけファイルを作る）
+    st.markdown("### データのダウンロード")
+    download_section(df, "rakuten_reviews", "rakuten")
+elif not start_button:
     st.info("👆 上のボタンをクリックしてスクレイピングを開始してください")
 
 # 使い方の説明
@@ -1,48 +1,39 @@
 import streamlit as st
-import openai
+import os
 import pandas as pd  # pandasをインポートしてExcelやCSVを処理
+from utils.article_view import run_check
+from utils.rule_index import RuleIndex
 
 # 固定のレギュレーションファイルのパス
 REGULATION_FILE_PATH = "regulation.xlsx"  # 固定のExcelファイルのパスを指定
 
+
+@st.cache_resource
+def load_rules(path, modified):
+    """固定のレギュレーションファイルを読み込んで語句の索引を作る（ファイルが更新されたときだけ作り直す）"""
+    return RuleIndex(pd.read_excel(path))
+
+
 # ページタイトル
 st.title("準備中のページ（使わないで）")
 
 # URL入力フォーム
 url = st.text_input("レギュレーションチェックしたい記事のURLを入力してください:")
+screen = st.checkbox("レギュレーションの語句が見つかった箇所だけをチェックする", value=True,
+                     help="語句・正規表現のないルールは、いつも本文全体と照らし合わせます")
+skip_clean = st.checkbox("語句が1つも見つからなければモデルを呼ばずに終える", value=False, disabled=not screen,
+                         help="APIの利用を減らせますが、語句のないルールや言い換えた表現はチェックしません")
 
 if st.button("チェック"):
     if url:
         try:
             # 固定のレギュレーションファイルの内容を読み込む
-            regulation_text = pd.read_excel(REGULATION_FILE_PATH).to_string(index=False)  # Excelファイルを読み込む
-
-            # OpenAI APIを使用してレギュレーションと記事を比較
-            prompt = f"""
-            以下のレギュレーションに基づいて、指定されたURLの内容がレギュレーションに抵触するかどうかを判断してください。
-
-            ## レギュレーション
-            {regulation_text}
-
-            ## 記事URL
-            {url}
-
-            ## 指示
-            記事がレギュレーションに抵触する場合は、その部分を指摘してください。
-            """
-            completion = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",  # または "gpt-4" を使用
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            rules = load_rules(REGULATION_FILE_PATH, os.path.getmtime(REGULATION_FILE_PATH))
 
-            # 抽出したテキストを表示
-            result_text = completion.choices[0].message['content']
-            st.subheader("チェック結果:")
-            st.text_area("結果", result_text, height=300)
+            # 記事の本文を取得し、語句で絞り込んでからレギュレーションと比較する
+            run_check(url, rules, screen, skip_clean)
 
         except Exception as e:
-            st.error(f"OpenAI APIエラー: {str(e)}")
+            st.error(f"エラーが発生しました: {str(e)}")
     else:
         st.warning("記事URLを入力してください。")
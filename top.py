@@ -78,7 +78,7 @@ if check_password():
     st.subheader("🔒 ハッシュ化")
     st.write("""
         - CSVファイルのデータをハッシュ化します
-        - SHA-256
+        - SHA-256（高速なBLAKE2b、キー付きのHMAC-SHA256も選べる）
         - ハッシュ化したデータをCSVでダウンロードできます
     """)
     if st.button("ハッシュ化ページへ", type="primary", use_container_width=True):
@@ -0,0 +1 @@
+"""各ページで共通して使う処理をまとめたパッケージ"""
@@ -0,0 +1,296 @@
+"""記事のレギュレーションチェック
+
+記事のHTMLを取得して本文だけを取り出し、モデルに渡せる長さのチャンクに分ける。
+チャンクごとにレギュレーションと照らし合わせ（map）、指摘をまとめて1つの結果にする（reduce）。
+モデルの出力はストリーミングで受け取り、届いたところから表示できるようにする。
+"""
+import functools
+import hashlib
+import re
+
+import openai
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+MODEL = "gpt-3.5-turbo"
+
+# 1回の呼び出しで使うトークン数の目安（入力と出力の合計。gpt-3.5-turbo の上限より余裕を持たせる）
+CONTEXT_TOKENS = 12_000
+# 出力のために空けておくトークン数
+RESPONSE_TOKENS = 1_500
+# 1チャンクの本文の最小トークン数（レギュレーションが長くてもこれだけは入れる）
+MIN_CHUNK_TOKENS = 500
+# プロンプトの決まり文句の分として空けておくトークン数
+PROMPT_TOKENS = 300
+# 1回の呼び出しに入れるレギュレーションのトークン数の上限（残りを本文に使う。超えるときは行で分ける）
+REGULATION_TOKENS = (CONTEXT_TOKENS - RESPONSE_TOKENS - PROMPT_TOKENS) // 2
+# やり直し用に覚えておくチャンクの結果の数（古いものから忘れる）
+MAX_DONE = 200
+
+# 本文ではない要素
+_SKIP_TAGS = ["script", "style", "noscript", "template", "nav", "header", "footer", "aside", "form", "iframe", "svg"]
+# 本文の段落として読む要素
+_BLOCK_XPATH = ".//*[self::p or self::h1 or self::h2 or self::h3 or self::h4 or self::li or self::blockquote or self::td or self::th]"
+_SENTENCE_END = re.compile(r"(?<=[。！？!?])")
+# XHTMLの先頭の <?xml ... encoding="..."?>（文字列にしたあとで lxml に渡すとエラーになる）
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    if not HAS_TIKTOKEN:
+        return None
+    try:
+        return tiktoken.encoding_for_model(MODEL)
+    except Exception:
+        # 初回に辞書をダウンロードできない環境では見積もりで数える
+        return None
+
+
+def estimate_tokens(text):
+    """トークン数を数える
+
+    tiktoken が使えればモデルと同じ数え方で数える。使えなければ、漢字は1文字で2トークン以上になることがあるので
+    日本語は1文字2トークン、英数字は4文字で1トークンとして多めに見積もる。
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return 2 * (len(text) - ascii_chars) + -(-ascii_chars // 4)
+
+
+def _blocks_lxml(html):
+    # metaタグが無いページでも文字化けしないよう、UTF-8で読めるものは先に文字列にしておく
+    # （読めなければバイト列のまま渡し、metaタグの文字コードで読んでもらう）
+    if isinstance(html, bytes):
+        try:
+            html = html.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    if isinstance(html, str):
+        html = _XML_DECLARATION.sub("", html, count=1)
+    root = lxml.html.fromstring(html)
+    for element in root.xpath("//" + " | //".join(_SKIP_TAGS)):
+        element.drop_tree()
+    # <article> や <main> があればその中だけを本文とする
+    candidates = root.xpath("//article") or root.xpath("//main") or root.xpath("//body") or [root]
+    container = max(candidates, key=lambda element: len(element.text_content()))
+    blocks = []
+    for element in container.xpath(_BLOCK_XPATH):
+        # 入れ子になった段落（li の中の p など）は内側だけを使う
+        if element.xpath(_BLOCK_XPATH):
+            continue
+        text = " ".join(element.text_content().split())
+        if text:
+            blocks.append(text)
+    return blocks
+
+
+def _blocks_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(_SKIP_TAGS):
+        element.decompose()
+    container = soup.find("article") or soup.find("main") or soup.body or soup
+    return [" ".join(line.split()) for line in container.get_text("\n").splitlines() if line.strip()]
+
+
+def extract_main_text(html):
+    """記事のHTMLから本文（見出し・段落・箇条書き）を取り出し、段落ごとに改行でつないで返す"""
+    blocks = _blocks_lxml(html) if HAS_LXML else _blocks_bs4(html)
+    # 同じ文言の繰り返し（パンくずや共有ボタンなど）は1回だけにする
+    return "\n".join(dict.fromkeys(blocks))
+
+
+def chunk_text(text, max_tokens):
+    """本文を段落の切れ目で max_tokens 以内のチャンクに分ける（長すぎる段落は文の切れ目で分ける）"""
+    pieces = []
+    for paragraph in text.split("\n"):
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            # 句点のない長い文は文字数で切る（1文字が4トークンを超えることはないので、max_tokens/4 文字ずつ）
+            step = max(1, max_tokens // 4)
+            while estimate_tokens(sentence) > max_tokens:
+                pieces.append(sentence[:step])
+                sentence = sentence[step:]
+            if sentence:
+                pieces.append(sentence)
+
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        # つなぐ改行の分も数える
+        tokens = estimate_tokens(piece) + 1
+        if current and size + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def regulation_text(df):
+    """レギュレーションの表をプロンプトに入れる文字列にする"""
+    return df.fillna("").to_string(index=False)
+
+
+def split_regulation(regulation, max_tokens=REGULATION_TOKENS):
+    """長すぎるレギュレーションを、見出し行をつけたまま max_tokens 以内に行で分ける"""
+    if estimate_tokens(regulation) <= max_tokens:
+        return [regulation]
+    header, _, body = regulation.partition("\n")
+    budget = max(MIN_CHUNK_TOKENS, max_tokens - estimate_tokens(header))
+    return [f"{header}\n{part}" for part in chunk_text(body, budget)]
+
+
+def chunk_budget(regulation):
+    """レギュレーション（分けたときは一番長いもの）を入れたうえで、1チャンクの本文に使えるトークン数"""
+    largest = max(estimate_tokens(part) for part in split_regulation(regulation))
+    return max(MIN_CHUNK_TOKENS, CONTEXT_TOKENS - RESPONSE_TOKENS - largest - PROMPT_TOKENS)
+
+
+def chunk_key(regulation, chunk, model=MODEL):
+    """チャンクのチェック結果を使い回すためのキー（レギュレーション・本文・モデルが同じなら同じ）"""
+    return hashlib.blake2b(f"{model}\0{regulation}\0{chunk}".encode(), digest_size=16).hexdigest()
+
+
+def map_messages(regulation, chunk, index, total, url=None, excerpt=False):
+    """1チャンク分のチェックを頼むメッセージ（excerpt なら本文全体ではなく抜き出した箇所として頼む）"""
+    source = f"（{url} の本文 {index}/{total}）" if url else f"（本文 {index}/{total}）"
+    if excerpt:
+        source = "から抜き出した箇所" + source
+    prompt = f"""以下のレギュレーションに基づいて、記事の本文{source}がレギュレーションに抵触するかどうかを判断してください。
+
+## レギュレーション
+{regulation}
+
+## 記事の本文
+{chunk}
+
+## 指示
+抵触する箇所があれば、該当する本文をそのまま引用し、どのレギュレーションに抵触するかと理由を箇条書きで答えてください。
+抵触する箇所がなければ「指摘なし」とだけ答えてください。"""
+    return [{"role": "user", "content": prompt}]
+
+
+def reduce_messages(findings):
+    """チャンクごとの指摘を1つの結果にまとめてもらうメッセージ"""
+    joined = "\n\n".join(f"### 本文 {index}/{len(findings)}\n{finding}" for index, finding in enumerate(findings, 1))
+    prompt = f"""記事を分割してレギュレーションチェックした結果です。重複をまとめ、1つのチェック結果として整理してください。
+
+{joined}
+
+## 指示
+抵触する箇所ごとに、引用・該当するレギュレーション・理由を箇条書きで答えてください。
+どの部分にも指摘がなければ「レギュレーションに抵触する箇所は見つかりませんでした」と答えてください。"""
+    return [{"role": "user", "content": prompt}]
+
+
+def stream_completion(messages, on_delta=None, model=MODEL):
+    """ChatCompletion をストリーミングで呼び、届いた分までの文字列を on_delta に渡しながら全文を返す"""
+    response = openai.ChatCompletion.create(model=model, messages=messages, stream=True)
+    parts = []
+    for event in response:
+        delta = event["choices"][0]["delta"].get("content")
+        if delta:
+            parts.append(delta)
+            if on_delta:
+                on_delta("".join(parts))
+    return "".join(parts)
+
+
+def _truncate(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return chunk_text(text, max_tokens)[0] + "\n（以下省略）"
+
+
+def _reduce(findings, on_delta=None, model=MODEL):
+    """指摘を1つにまとめる。1回で入りきらなければ、入る分ずつまとめたものをさらにまとめる"""
+    budget = CONTEXT_TOKENS - RESPONSE_TOKENS - PROMPT_TOKENS
+    # 1つだけで上限を超える指摘は、まとめる数を残せるよう半分までに切る
+    findings = [_truncate(finding, budget // 2) for finding in findings]
+    while True:
+        groups, size = [[]], 0
+        for finding in findings:
+            tokens = estimate_tokens(finding) + 20
+            if groups[-1] and size + tokens > budget:
+                groups.append([])
+                size = 0
+            groups[-1].append(finding)
+            size += tokens
+        if len(groups) == 1:
+            return stream_completion(reduce_messages(groups[0]), on_delta=on_delta, model=model)
+        findings = [stream_completion(reduce_messages(group), on_delta=on_delta, model=model) for group in groups]
+
+
+def _remember(done, key, finding):
+    # 新しく使ったものを後ろに回し、MAX_DONE を超えたら古いものから消す
+    done.pop(key, None)
+    done[key] = finding
+    while len(done) > MAX_DONE:
+        done.pop(next(iter(done)))
+
+
+def count_steps(jobs):
+    """check_jobs が map で呼ぶ回数（進み具合の全数）"""
+    return sum(len(split_regulation(regulation)) * len(chunks) for chunks, regulation, _ in jobs)
+
+
+def check_jobs(jobs, done, url=None, on_chunk=None, on_delta=None, model=MODEL):
+    """(チャンクのリスト, レギュレーション, excerpt) の組ごとにチェックし（map）、指摘をまとめて（reduce）最終結果を返す
+
+    done はチャンクのキー→結果の辞書。ここにある結果は送り直さず使い、新しい結果は書き足す
+    （途中で失敗してもやり直したときに終わったチャンクは送らない）。覚えておくのは新しい MAX_DONE 件まで。
+    on_chunk(番号, 全数, 結果) はチャンクが終わるたびに、on_delta(番号, 途中の文字列) はストリーミング中に呼ぶ。
+    reduce の番号は 0。excerpt は chunks が本文全体ではなく抜き出した箇所のとき True にする。
+    レギュレーションが1回に入りきらないときは split_regulation で分け、分けたものごとに全チャンクをチェックする。
+    """
+    total = count_steps(jobs)
+    findings = []
+    step = 0
+    for chunks, regulation, excerpt in jobs:
+        for part in split_regulation(regulation):
+            for index, chunk in enumerate(chunks, 1):
+                step += 1
+                key = chunk_key(part, chunk, model)
+                finding = done.get(key)
+                if finding is None:
+                    finding = stream_completion(
+                        map_messages(part, chunk, index, len(chunks), url, excerpt),
+                        on_delta=(lambda text, step=step: on_delta(step, text)) if on_delta else None,
+                        model=model,
+                    )
+                _remember(done, key, finding)
+                findings.append(finding)
+                if on_chunk:
+                    on_chunk(step, total, finding)
+
+    if len(findings) == 1:
+        return findings[0]
+    # 指摘のないチャンクしかなければまとめる必要はない
+    findings = [finding for finding in findings if finding.strip() != "指摘なし"]
+    if not findings:
+        return "レギュレーションに抵触する箇所は見つかりませんでした"
+    if len(findings) == 1:
+        return findings[0]
+    return _reduce(findings, on_delta=(lambda text: on_delta(0, text)) if on_delta else None, model=model)
+
+
+def check_article(chunks, regulation, done, url=None, on_chunk=None, on_delta=None, model=MODEL, excerpt=False):
+    """1つの本文（チャンクのリスト）を1つのレギュレーションでチェックする（check_jobs の組が1つのとき）"""
+    return check_jobs([(chunks, regulation, excerpt)], done, url, on_chunk, on_delta, model)
@@ -0,0 +1,87 @@
+"""記事のレギュレーションチェックの画面部品（5_kijicheck と regu_test で共通）"""
+import streamlit as st
+
+from utils.article import check_jobs, chunk_budget, chunk_text, count_steps, extract_main_text
+from utils.fetcher import Fetcher
+from utils.http_cache import shared_cache
+from utils.rule_index import suspicious_passages
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+@st.cache_resource
+def get_fetcher():
+    """再実行をまたいで接続プールを使い回すためにFetcherをキャッシュする"""
+    return Fetcher(max_workers=2, per_host=2, min_interval=0.5, headers=HEADERS, cache=shared_cache())
+
+
+def run_check(url, rules, screen=True, skip_clean=False):
+    """記事を取得して本文をチャンクに分け、チェック結果をストリーミングで表示する
+
+    rules は RuleIndex。screen なら先に手元でレギュレーションの語句を探し、当たった箇所は当たったルールと、
+    本文全体は語句も正規表現もないルールと照らし合わせる。何も当たらなければ「語句なし」と表示して
+    本文全体をレギュレーション全体でチェックする（skip_clean ならモデルを呼ばずに終える）。
+    """
+    html = get_fetcher().get(url)
+    text = extract_main_text(html)
+    if not text:
+        st.warning("記事の本文を取り出せませんでした。URLを確認してください。")
+        return
+
+    with st.expander("取得した本文"):
+        st.text(text)
+
+    # (送る本文, レギュレーション, 抜き出した箇所かどうか) の組
+    jobs = []
+    paragraphs = text.split("\n")
+    hits = rules.scan(paragraphs) if screen and len(rules) else []
+    if screen and not len(rules):
+        st.caption("レギュレーションに語句・正規表現の列が見つからないため、本文全体を送ります")
+    elif screen and not hits and skip_clean:
+        st.subheader("チェック結果:")
+        st.info(f"語句なし: レギュレーションの語句（{len(rules):,}件）は本文に見つかりませんでした。"
+                "モデルには送っていないので、語句のないルールや言い換えた表現はチェックしていません")
+        return
+    elif screen and not hits:
+        st.info(f"語句なし: レギュレーションの語句（{len(rules):,}件）は本文に見つかりませんでした。"
+                "語句では分からないルールもあるため、本文全体をチェックします")
+    elif hits:
+        rows = len({row for _, _, rows in hits for row in rows})
+        st.caption(f"レギュレーションの語句が{len(hits)}段落で見つかりました。該当する箇所を{rows}行のルールと照らし合わせます")
+        with st.expander("見つかった語句"):
+            st.dataframe(rules.hit_table(paragraphs, hits), hide_index=True)
+        # 離れた箇所のあいだには「…」の行を入れる
+        jobs.append(("\n…\n".join(suspicious_passages(paragraphs, hits)), rules.relevant_regulation(hits), True))
+        # 語句のないルールは手元で調べられないので、本文全体と照らし合わせる
+        unscreened = rules.unscreened_regulation()
+        if unscreened:
+            st.caption("語句・正規表現のないルールは、本文全体と照らし合わせます")
+            jobs.append((text, unscreened, False))
+    if not jobs:
+        jobs.append((text, rules.regulation, False))
+
+    jobs = [(chunk_text(body, chunk_budget(regulation)), regulation, excerpt) for body, regulation, excerpt in jobs]
+    total = count_steps(jobs)
+    st.caption(f"{sum(len(chunks) for chunks, _, _ in jobs)}つの本文のかたまりを、{total}回に分けてチェックします")
+
+    # 終わったチャンクの結果はセッションに残し、やり直したときに送り直さない
+    done = st.session_state.setdefault("article_check_done", {})
+    progress = st.progress(0.0)
+    live = st.empty()
+
+    def on_delta(index, text):
+        heading = "結果をまとめています..." if index == 0 else f"{index}/{total} をチェック中..."
+        live.markdown(f"**{heading}**\n\n{text}")
+
+    def on_chunk(index, total, finding):
+        progress.progress(index / total)
+
+    result = check_jobs(jobs, done, url=url, on_chunk=on_chunk, on_delta=on_delta)
+    progress.empty()
+    live.empty()
+
+    # 抽出したテキストを表示
+    st.subheader("チェック結果:")
+    st.text_area("結果", result, height=300)
@@ -0,0 +1,136 @@
+"""楽天スクレイピング用のChromeドライバー管理"""
+import atexit
+import contextlib
+import threading
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+
+# レビューの取得に不要なので読み込まない（画像・フォント・CSS）
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.css",
+]
+
+
+def create_driver():
+    """画像・フォント・CSSを読み込まない軽量なヘッドレスChromeを起動する"""
+    chrome_options = Options()
+    chrome_options.add_argument('--headless=new')  # ヘッドレスモードで実行
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--disable-extensions')
+    chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+    chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    # DOMの構築が終わった時点で制御を返し、あとは明示的な待機で必要な要素を待つ
+    chrome_options.page_load_strategy = "eager"
+
+    driver = webdriver.Chrome(options=chrome_options)
+    try:
+        driver.set_page_load_timeout(30)
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    except Exception:
+        driver.quit()
+        raise
+    return driver
+
+
+class DriverPool:
+    """Chromeドライバーを起動したまま使い回すプール
+
+    driver() で借りて、ブロックを抜けると返却される。ブロック内で例外が起きたドライバーは
+    状態が信用できないので終了させ、次に必要になったときに起動し直す。
+    プロセス終了時には残っているドライバーをすべて終了させる。
+    """
+
+    def __init__(self, size=1, factory=create_driver):
+        self.size = size
+        self._factory = factory
+        self._idle = []
+        self._drivers = set()
+        # 空きドライバーと枠の変化を待つための条件変数（_idle・_drivers はこのロックの中で触る）
+        self._cond = threading.Condition()
+        self._closed = False
+        atexit.register(self.close)
+
+    @contextlib.contextmanager
+    def driver(self):
+        """ドライバーを1つ借りる"""
+        driver = self._acquire()
+        try:
+            yield driver
+        except BaseException:
+            self._discard(driver)
+            raise
+        else:
+            self._release(driver)
+
+    def _release(self, driver):
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    def _acquire(self):
+        while True:
+            driver = self._take_or_start()
+            if self._alive(driver):
+                return driver
+            self._discard(driver)
+
+    def _take_or_start(self):
+        # 起きるたびに、空きドライバーがあれば使い、枠が空いていれば起動する
+        # （貸し出し中のドライバーが例外で捨てられたときも、枠が空くので待ち続けない）
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("DriverPool は終了しています")
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._drivers) < self.size:
+                    # 起動中に他のスレッドが枠を使わないよう先に予約しておく
+                    placeholder = object()
+                    self._drivers.add(placeholder)
+                    break
+                self._cond.wait()
+        try:
+            driver = self._factory()
+        except BaseException:
+            with self._cond:
+                self._drivers.discard(placeholder)
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._drivers.discard(placeholder)
+            self._drivers.add(driver)
+        return driver
+
+    @staticmethod
+    def _alive(driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _discard(self, driver):
+        with self._cond:
+            self._drivers.discard(driver)
+            self._cond.notify()
+        with contextlib.suppress(Exception):
+            driver.quit()
+
+    def close(self):
+        """すべてのドライバーを終了する"""
+        with self._cond:
+            self._closed = True
+            drivers = list(self._drivers)
+            self._drivers.clear()
+            self._idle.clear()
+            self._cond.notify_all()
+        for driver in drivers:
+            with contextlib.suppress(Exception):
+                driver.quit()
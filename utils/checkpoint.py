@@ -0,0 +1,86 @@
+"""スクレイピングの途中経過の保存と再開"""
+import json
+import re
+import sqlite3
+import time
+
+from utils.http_cache import CACHE_DIR
+
+CHECKPOINT_DIR = CACHE_DIR / "checkpoints"
+
+
+def checkpoint_path(site, product_id, directory=CHECKPOINT_DIR):
+    """サイトと商品IDから保存先のファイルパスを決める"""
+    name = re.sub(r"[^0-9A-Za-z_-]", "_", f"{site}_{product_id}")
+    return directory / f"{name}.sqlite"
+
+
+class ScrapeCheckpoint:
+    """ページごとに取得済みのレビューを保存し、再実行時に続きから再開できるようにする
+
+    レビューはURLをキーに保存するので、同じレビューが別のページに出てきても二重には取得しない。
+    """
+
+    def __init__(self, site, product_id, directory=CHECKPOINT_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = checkpoint_path(site, product_id, directory)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page INTEGER PRIMARY KEY,
+                review_count INTEGER NOT NULL,
+                done_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS reviews (
+                url TEXT PRIMARY KEY,
+                page INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def completed_pages(self):
+        """取得し終わったページ番号の集合"""
+        return {row[0] for row in self._conn.execute("SELECT page FROM pages")}
+
+    def seen_urls(self):
+        """保存済みのレビューURLの集合"""
+        return {row[0] for row in self._conn.execute("SELECT url FROM reviews")}
+
+    def page_rows(self, page):
+        """指定ページで保存したレビューを取得順に返す"""
+        rows = self._conn.execute("SELECT data FROM reviews WHERE page = ? ORDER BY seq", (page,))
+        return [json.loads(data) for (data,) in rows]
+
+    def review_count(self):
+        """保存済みのレビュー件数"""
+        return self._conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    def save_page(self, page, reviews):
+        """1ページ分のレビュー（URLと行のペア）を保存し、そのページを完了にする"""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?)",
+                [(url, page, seq, json.dumps(row, ensure_ascii=False)) for seq, (url, row) in enumerate(reviews)],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", (page, len(reviews), time.time())
+            )
+
+    def clear(self):
+        """途中経過をすべて削除する"""
+        with self._conn:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM reviews")
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
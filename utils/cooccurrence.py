@@ -0,0 +1,123 @@
+"""単語の共起（同じ文書に一緒に出てくること）とn-gramを疎行列で数える
+
+どちらも出現数が min_support 未満のものは捨て、多い順に top_k 件だけ返す。
+共起は文書数の多い max_terms 語だけで数えるので、行列の大きさは max_terms×max_terms を超えない。
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils.tokens import select_tokens
+
+# 共起を数える単語の数の上限（文書数の多い順）
+MAX_TERMS = 2000
+
+
+def doc_term_matrix(table, pos=None, field="surface", min_length=2):
+    """文書×単語の疎行列（その文書に出てくれば1）と、列に対応する単語を返す
+
+    行は単語が1つ以上ある文書だけ、列は出てきた単語だけにする。
+    """
+    selected = select_tokens(table, pos, field, min_length)
+    terms = selected[field]
+    docs, rows = np.unique(selected["doc"].to_numpy(), return_inverse=True)
+    codes, cols = np.unique(terms.cat.codes.to_numpy(), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(len(docs), len(codes)),
+    )
+    # 同じ文書に同じ単語が何回出ても1として数える
+    matrix.data[:] = 1
+    return matrix, terms.cat.categories[codes].astype(str)
+
+
+def _top(series, min_support, top_k):
+    series = series[series >= min_support].sort_values(ascending=False, kind="stable")
+    return series.head(top_k) if top_k else series
+
+
+def cooccurrence(table, pos=None, field="surface", min_length=2, min_support=1, top_k=None, max_terms=MAX_TERMS):
+    """2つの単語が同じ文書に出てきた文書数を、(単語1, 単語2) を索引にして多い順に返す（単語1 < 単語2）"""
+    matrix, terms = doc_term_matrix(table, pos, field, min_length)
+    # 文書数が min_support 未満の単語は、どの組み合わせでも min_support に届かないので先に落とす
+    doc_freq = np.asarray(matrix.sum(axis=0)).ravel()
+    keep = np.flatnonzero(doc_freq >= min_support)
+    if max_terms and len(keep) > max_terms:
+        keep = keep[np.argsort(-doc_freq[keep], kind="stable")[:max_terms]]
+        keep.sort()
+    matrix = matrix[:, keep]
+    terms = terms[keep]
+
+    counts = sparse.triu(matrix.T @ matrix, k=1).tocoo()
+    # 列の並びはチャンクごとの単語の番号順なので、組み合わせは文字列の順にそろえる
+    # （チャンクをまたいで足し合わせるときに (A, B) と (B, A) が別に数えられないように）
+    first = np.asarray(terms[counts.row], dtype=object)
+    second = np.asarray(terms[counts.col], dtype=object)
+    swap = first > second
+    first[swap], second[swap] = second[swap], first[swap]
+    index = pd.MultiIndex.from_arrays([first, second], names=["単語1", "単語2"])
+    return _top(pd.Series(counts.data, index=index, name="count"), min_support, top_k)
+
+
+def ngrams(table, n=2, pos=None, field="surface", min_support=1, top_k=None):
+    """同じ文書の中で続けて出てくる n 語の並びの出現回数を、多い順に返す（索引は「語 語 …」）
+
+    pos を指定すると、n 語がすべてその品詞のものだけを数える（例：名詞が続く複合語）。
+    """
+    terms = table[field]
+    codes = terms.cat.codes.to_numpy().astype(np.int64)
+    docs = table["doc"].to_numpy()
+    if len(codes) < n:
+        return pd.Series([], index=pd.Index([], dtype=str), dtype="int64", name="count")
+
+    # i 番目から n 語が同じ文書に収まっている位置だけを使う
+    starts = np.arange(len(codes) - n + 1)
+    valid = docs[starts] == docs[starts + n - 1]
+    if pos is not None:
+        in_pos = table["pos"].isin(pos).to_numpy()
+        for offset in range(n):
+            valid &= in_pos[starts + offset]
+    starts = starts[valid]
+
+    # n 語の番号を1つの整数にまとめて数える（語彙数の n 乗が int64 に収まらないときは行ごとに数える）
+    size = len(terms.cat.categories)
+    if size ** n < 2 ** 63:
+        keys = np.zeros(len(starts), dtype=np.int64)
+        for offset in range(n):
+            keys = keys * size + codes[starts + offset]
+        keys, counts = np.unique(keys, return_counts=True)
+        grams = np.stack([keys // size ** (n - 1 - offset) % size for offset in range(n)], axis=1)
+    else:
+        windows = np.stack([codes[starts + offset] for offset in range(n)], axis=1)
+        grams, counts = np.unique(windows, axis=0, return_counts=True)
+
+    # 文字列にするのは残すものだけ
+    keep = np.flatnonzero(counts >= min_support)
+    keep = keep[np.argsort(-counts[keep], kind="stable")]
+    if top_k:
+        keep = keep[:top_k]
+    vocabulary = terms.cat.categories.astype(str).to_numpy()
+    index = [" ".join(vocabulary[gram]) for gram in grams[keep]]
+    return pd.Series(counts[keep], index=index, name="count")
+
+
+def network_dot(pairs, term_counts=None):
+    """(単語1, 単語2) ごとの回数から、共起ネットワークのGraphviz（DOT）の文字列を作る
+
+    線の太さは回数、term_counts を渡すと単語の文字の大きさは出現回数に合わせる。
+    """
+    def quote(text):
+        return '"' + str(text).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+    lines = ["graph {", '  layout=neato; overlap=false; splines=true;', '  node [shape=ellipse, style=filled, fillcolor="#fff3e0"];']
+    if len(pairs):
+        top = pairs.max()
+        nodes = sorted(set(pairs.index.get_level_values(0)) | set(pairs.index.get_level_values(1)))
+        if term_counts is not None and len(term_counts):
+            largest = max(term_counts.get(node, 0) for node in nodes) or 1
+            for node in nodes:
+                lines.append(f"  {quote(node)} [fontsize={10 + 14 * term_counts.get(node, 0) / largest:.0f}];")
+        for (left, right), count in pairs.items():
+            lines.append(f"  {quote(left)} -- {quote(right)} [penwidth={1 + 4 * count / top:.1f}, tooltip={quote(count)}];")
+    lines.append("}")
+    return "\n".join(lines)
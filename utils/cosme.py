@@ -0,0 +1,94 @@
+"""@cosmeのレビュー取得処理（Streamlitページとバッチの両方から使う）"""
+import re
+
+import pandas as pd
+
+from utils.parsing import cosme_review_fields, cosme_review_links
+from utils.reviewer_attrs import extract_attributes
+
+BASE_URL = "https://www.cosme.net/products/{product_id}/review/?page="
+
+# 1件のレビューとして返す項目
+FIELDS = ["score", "reviewer_info", "comment"]
+# to_frame() で作る表の列
+COLUMNS = ["score", "age", "skin_type", "comment", "reviewer_info"]
+
+
+def review_list_url(product_id, page):
+    """商品IDとページ番号からレビュー一覧のURLを作る"""
+    return BASE_URL.format(product_id=product_id) + str(page)
+
+
+def parse_review(html):
+    """口コミ詳細ページのHTMLから1件分のレビューを取り出す
+
+    年齢や肌タイプはレビュアー情報のまま保存し、to_frame() でまとめて取り出す。
+    """
+    fields = cosme_review_fields(html)
+
+    #スコア情報を取得
+    score = None
+    if fields["rating"] is not None:
+        matches = re.findall(r"[0-9]+", fields["rating"])
+        if matches:
+            score = int(matches[0])
+
+    return {
+        "score": score,
+        "reviewer_info": fields["reviewer_info"],
+        "comment": fields["comment"]
+    }
+
+
+def to_frame(rows):
+    """取得したレビューを、年齢・肌タイプの列を付けたDataFrameにする"""
+    df = pd.DataFrame(list(rows), columns=FIELDS)
+    attrs = extract_attributes(df["reviewer_info"])
+    return pd.DataFrame({
+        "score": df["score"].astype("Int64"),
+        "age": attrs["age"],
+        "skin_type": attrs["skin_type"],
+        "comment": df["comment"],
+        "reviewer_info": df["reviewer_info"],
+    })
+
+
+def iter_reviews(product_id, max_pages, fetcher, on_page=None, checkpoint=None):
+    """レビューを1件ずつ返すジェネレーター
+
+    ページを読み終えるたびに on_page(ページ番号, そのページのレビュー数) を呼ぶ。
+    レビューが見つからないページに来たら件数にNoneを渡してから終了する。
+    checkpoint を渡すとページごとに途中経過を保存し、取得済みのページは保存した内容を返す。
+    """
+    completed = checkpoint.completed_pages() if checkpoint else set()
+    seen = checkpoint.seen_urls() if checkpoint else set()
+
+    for page in range(1, max_pages + 1):
+        # 前回取得し終わったページはサイトにアクセスしない
+        if page in completed:
+            rows = checkpoint.page_rows(page)
+            yield from rows
+            if on_page:
+                on_page(page, len(rows))
+            continue
+
+        review_urls = cosme_review_links(fetcher.get(review_list_url(product_id, page)))
+
+        # レビューが見つからない場合は終了
+        if not review_urls:
+            if on_page:
+                on_page(page, None)
+            return
+
+        # 取得済みのレビューは飛ばし、残りの詳細ページはまとめて並列に取得する（結果はページ内の順番のまま）
+        new_urls = [url for url in dict.fromkeys(review_urls) if url not in seen]
+        rows = [parse_review(review_html) for review_html in fetcher.get_many(new_urls)]
+
+        # 呼び出し側に渡す前に保存しておく
+        if checkpoint:
+            checkpoint.save_page(page, list(zip(new_urls, rows)))
+        seen.update(new_urls)
+        yield from rows
+
+        if on_page:
+            on_page(page, len(rows))
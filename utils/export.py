@@ -0,0 +1,119 @@
+"""結果の表をダウンロード用のファイルにする
+
+CSV・gzip圧縮したCSV・Parquet（zstd圧縮）・Excelに対応する。
+ファイルはボタンが押されたときだけ作り、同じ表・同じ形式なら作ったものを使い回す。
+"""
+import gzip
+import hashlib
+import io
+
+import pandas as pd
+import streamlit as st
+
+# 画面に出す名前: (拡張子, MIMEタイプ)
+FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV（gzip圧縮）": (".csv.gz", "application/gzip"),
+    "Parquet（zstd圧縮）": (".parquet", "application/octet-stream"),
+    "Excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+# CSVの文字コードは前から順に試す（Shift-JISで表せない絵文字などがあればUTF-8にする）
+CSV_ENCODINGS = ("shift-jis", "cp932", "utf-8-sig")
+
+
+def fingerprint(df):
+    """表の中身から作る指紋（同じ結果かどうかの判定に使う）"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def to_csv_bytes(df, encodings=CSV_ENCODINGS):
+    """CSVのバイト列と、実際に使った文字コードを返す"""
+    text = df.to_csv(index=False)
+    for encoding in encodings[:-1]:
+        try:
+            return text.encode(encoding), encoding
+        except UnicodeEncodeError:
+            continue
+    return text.encode(encodings[-1]), encodings[-1]
+
+
+def header_encoding(columns, encodings=CSV_ENCODINGS):
+    """見出しを表せる最初の文字コード（値がASCIIだけのCSVを少しずつ書き出すときに使う）"""
+    header = ",".join(str(column) for column in columns)
+    for encoding in encodings[:-1]:
+        try:
+            header.encode(encoding)
+            return encoding
+        except UnicodeEncodeError:
+            continue
+    return encodings[-1]
+
+
+def _to_excel_bytes(df):
+    # Excelのセルに入れられない制御文字は取り除く
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    cleaned = df.copy()
+    for column in cleaned.columns:
+        if not pd.api.types.is_numeric_dtype(cleaned[column]):
+            cleaned[column] = cleaned[column].map(
+                lambda value: ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value
+            )
+    buffer = io.BytesIO()
+    cleaned.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def export_bytes(df, file_format, encodings=CSV_ENCODINGS):
+    """選んだ形式のバイト列と、CSVなら使った文字コード（それ以外は None）を返す"""
+    if file_format == "CSV":
+        return to_csv_bytes(df, encodings)
+    if file_format == "CSV（gzip圧縮）":
+        data, encoding = to_csv_bytes(df, encodings)
+        return gzip.compress(data, compresslevel=6), encoding
+    if file_format == "Parquet（zstd圧縮）":
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False, compression="zstd")
+        return buffer.getvalue(), None
+    if file_format == "Excel":
+        return _to_excel_bytes(df), None
+    raise ValueError(f"未対応の形式です: {file_format}")
+
+
+@st.cache_data(show_spinner="ダウンロード用のファイルを作成中...", max_entries=16)
+def _export_cached(_df, key, file_format, encodings):
+    # _df はキャッシュのキーにせず、指紋 key で見分ける
+    return export_bytes(_df, file_format, encodings)
+
+
+def download_section(df, file_name, key, label="📥 データをダウンロード", encodings=CSV_ENCODINGS):
+    """形式を選んでボタンを押したときだけファイルを作り、ダウンロードボタンを出す
+
+    file_name は拡張子なしの名前。key は同じページに複数置くときに区別するための名前。
+    """
+    file_format = st.selectbox("ファイル形式", list(FORMATS), key=f"{key}_format")
+    state_key = f"{key}_export"
+    clicked = st.button("📦 ダウンロード用のファイルを作成", key=f"{key}_prepare")
+    prepared = st.session_state.get(state_key)
+    if not clicked and (not prepared or prepared[1] != file_format):
+        return
+    # 結果が変わっていたら前に作ったファイルは出さない
+    current = fingerprint(df)
+    if clicked:
+        prepared = st.session_state[state_key] = (current, file_format)
+    elif prepared[0] != current:
+        return
+    data, encoding = _export_cached(df, prepared[0], file_format, tuple(encodings))
+    if encoding and encoding != encodings[0]:
+        st.caption(f"⚠️ {encodings[0]}で表せない文字（絵文字など）があったため、{encoding}で書き出しました")
+    extension, mime = FORMATS[file_format]
+    st.download_button(
+        label=label,
+        data=data,
+        file_name=file_name + extension,
+        mime=mime,
+        key=f"{key}_download",
+    )
@@ -0,0 +1,129 @@
+"""スクレイピング用の共通HTTPクライアント"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.ratelimit import AdaptiveRateLimiter
+
+
+# 混雑・障害を表すステータス（速度を落として再試行する）
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _retry_after(response):
+    """Retry-After ヘッダーの秒数（日付形式などは扱わない）"""
+    value = response.headers.get("Retry-After", "")
+    return float(value) if value.isdigit() else None
+
+
+class HostGate:
+    """ホストごとの同時接続数とアクセス頻度を制御する"""
+
+    def __init__(self, max_concurrency, rate, burst):
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.limiter = AdaptiveRateLimiter(rate, burst)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        self.limiter.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._semaphore.release()
+
+
+class Fetcher:
+    """コネクションを使い回しながら複数のURLを並列に取得する
+
+    ホストごとに同時接続数を per_host までに抑え、リクエストの開始間隔を平均 min_interval 秒
+    （burst 件までは連続可）に保つ。429や5xxが返ってきたら速度を落として max_retries 回まで再試行する。
+    """
+
+    def __init__(self, max_workers=8, per_host=4, min_interval=0.2, burst=1, max_retries=3,
+                 timeout=30, headers=None, cache=None):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.rate = 1 / min_interval if min_interval > 0 else 50.0
+        self.burst = burst
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache = cache
+
+        # Keep-Aliveで接続を使い回す（プールはワーカー数と同じ大きさにする）
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._gates = {}
+        self._gates_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _gate(self, url):
+        host = urlsplit(url).netloc
+        with self._gates_lock:
+            gate = self._gates.get(host)
+            if gate is None:
+                gate = self._gates[host] = HostGate(self.per_host, self.rate, self.burst)
+            return gate
+
+    def get(self, url):
+        """URLを1件取得して本文(bytes)を返す（キャッシュがあればそちらを優先する）"""
+        entry = self.cache.lookup(url) if self.cache is not None else None
+        if entry is not None and entry.fresh:
+            return entry.body
+
+        # 期限切れのキャッシュがあれば条件付きリクエストで再検証する
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        gate = self._gate(url)
+        for _ in range(self.max_retries + 1):
+            with gate:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code not in RETRY_STATUSES:
+                gate.limiter.succeed()
+                break
+            gate.limiter.backoff(_retry_after(response))
+
+        if entry is not None and response.status_code == 304:
+            self.cache.refresh(url)
+            return entry.body
+        response.raise_for_status()
+        if self.cache is not None:
+            self.cache.store(
+                url,
+                response.content,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        return response.content
+
+    def get_many(self, urls, return_exceptions=False):
+        """複数のURLを並列に取得し、渡した順番のまま本文のリストを返す
+
+        return_exceptions なら、取得に失敗したURLは例外を投げずにその例外をリストに入れる。
+        """
+        if return_exceptions:
+            return list(self._executor.map(self._get_or_error, urls))
+        return list(self._executor.map(self.get, urls))
+
+    def _get_or_error(self, url):
+        try:
+            return self.get(url)
+        except requests.RequestException as error:
+            return error
+
+    def close(self):
+        """スレッドと接続を後片付けする"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
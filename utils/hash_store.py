@@ -0,0 +1,116 @@
+"""値とハッシュ値の対応表をディスクに保存して使い回す"""
+import functools
+import hashlib
+import sqlite3
+import threading
+import time
+
+from utils.http_cache import CACHE_DIR
+
+# 保存する対応の上限件数（超えたら最後に使った日時が古い順に消す）
+DEFAULT_MAX_ENTRIES = 10_000_000
+
+# SQLiteに一度に渡す件数
+_BATCH = 50_000
+
+
+def namespace_for(algorithm, key=None):
+    """アルゴリズムとキーの組み合わせごとの名前空間（キーそのものは保存しない）"""
+    if not key:
+        return algorithm
+    key_bytes = key.encode() if isinstance(key, str) else key
+    return f"{algorithm}:{hashlib.sha256(key_bytes).hexdigest()[:16]}"
+
+
+class HashStore:
+    """値→ハッシュ値の対応をSQLiteに保存する
+
+    ハッシュ値にもインデックスを張っているので、ハッシュ値から元の値を引く逆引きも全件走査せずにできる。
+    元の値がそのまま保存されるので、使うかどうかは利用者が選べるようにしておくこと。
+    """
+
+    def __init__(self, path=CACHE_DIR / "hash_store.sqlite", max_entries=DEFAULT_MAX_ENTRIES):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS digests (
+                namespace TEXT NOT NULL,
+                value TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (namespace, value)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS digests_by_digest ON digests (namespace, digest)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS digests_by_use ON digests (used_at)")
+        self._conn.execute("CREATE TEMP TABLE keys (key TEXT PRIMARY KEY)")
+        self._conn.commit()
+
+    def _fill_keys(self, keys):
+        # 調べたい値を一時テーブルに入れてから結合すると、件数が多くても1回の問い合わせで済む
+        self._conn.execute("DELETE FROM keys")
+        for i in range(0, len(keys), _BATCH):
+            self._conn.executemany("INSERT OR IGNORE INTO keys VALUES (?)", ((k,) for k in keys[i:i + _BATCH]))
+
+    def lookup_many(self, namespace, values):
+        """保存済みの値について {値: ハッシュ値} を返す"""
+        with self._lock, self._conn:
+            self._fill_keys(values)
+            found = dict(self._conn.execute(
+                "SELECT d.value, d.digest FROM keys k JOIN digests d ON d.namespace = ? AND d.value = k.key",
+                (namespace,),
+            ))
+            self._conn.execute(
+                "UPDATE digests SET used_at = ? WHERE namespace = ? AND value IN (SELECT key FROM keys)",
+                (time.time(), namespace),
+            )
+        return found
+
+    def reverse_lookup(self, namespace, digests):
+        """保存済みのハッシュ値について {ハッシュ値: 元の値} を返す"""
+        with self._lock, self._conn:
+            self._fill_keys(digests)
+            return dict(self._conn.execute(
+                "SELECT d.digest, d.value FROM keys k JOIN digests d ON d.namespace = ? AND d.digest = k.key",
+                (namespace,),
+            ))
+
+    def store_many(self, namespace, pairs):
+        """(値, ハッシュ値) の組を保存する"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                ((namespace, value, digest, now) for value, digest in pairs),
+            )
+            self._evict()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # 上限の9割まで、使われていない順に削除する
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM digests WHERE rowid IN (SELECT rowid FROM digests ORDER BY used_at LIMIT ?)",
+            (excess,),
+        )
+
+    def count(self):
+        """保存している対応の件数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+
+    def clear(self):
+        """すべて削除する"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM digests")
+
+
+@functools.lru_cache(maxsize=None)
+def shared_store():
+    """全セッションで共有する対応表（プロセスにつき1つ）"""
+    return HashStore()
@@ -0,0 +1,135 @@
+"""列の値をハッシュ化する処理
+
+同じ値は1回だけハッシュ化し（factorizeしてから結果を元の並びに戻す）、
+種類が多いときは複数プロセスに分けて計算する。
+"""
+import hashlib
+import hmac
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.hash_store import namespace_for
+from utils.parallel import map_in_processes
+
+# 画面に出す名前と内部で使う名前
+ALGORITHMS = {
+    "SHA-256": "sha256",
+    "BLAKE2b（高速）": "blake2b",
+    "HMAC-SHA256（キー付き）": "hmac-sha256",
+}
+
+# ユニークな値がこれ以上あるときだけ複数プロセスを使う（少ないと起動の方が遅い）
+PARALLEL_THRESHOLD = 200_000
+
+
+def digest_function(algorithm, key=None):
+    """文字列を受け取って16進のハッシュ値を返す関数を作る"""
+    if algorithm == "sha256":
+        return lambda text: hashlib.sha256(text.encode()).hexdigest()
+    if algorithm == "blake2b":
+        return lambda text: hashlib.blake2b(text.encode(), digest_size=32).hexdigest()
+    if algorithm == "hmac-sha256":
+        if not key:
+            raise ValueError("HMAC-SHA256にはキーが必要です")
+        key_bytes = key.encode() if isinstance(key, str) else key
+        return lambda text: hmac.new(key_bytes, text.encode(), hashlib.sha256).hexdigest()
+    raise ValueError(f"未対応のアルゴリズムです: {algorithm}")
+
+
+def _hash_chunk(args):
+    # 別プロセスで呼ばれるのでモジュールの外から見える関数にしておく
+    texts, algorithm, key = args
+    digest = digest_function(algorithm, key)
+    return [digest(text) for text in texts]
+
+
+def hash_strings(texts, algorithm="sha256", key=None, workers=None):
+    """文字列のリストをハッシュ化する。件数が多ければ複数プロセスに分ける"""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(texts) < PARALLEL_THRESHOLD:
+        return _hash_chunk((texts, algorithm, key))
+
+    size = -(-len(texts) // (workers * 4))
+    chunks = [(texts[i:i + size], algorithm, key) for i in range(0, len(texts), size)]
+    digests = []
+    for part in map_in_processes(_hash_chunk, chunks, workers):
+        digests.extend(part)
+    return digests
+
+
+def _hash_with_store(texts, algorithm, key, workers, store):
+    # 保存済みの値はそのまま使い、新しい値だけ計算して保存する
+    namespace = namespace_for(algorithm, key)
+    found = store.lookup_many(namespace, texts)
+    missing = [text for text in texts if text not in found]
+    if missing:
+        computed = hash_strings(missing, algorithm, key, workers)
+        store.store_many(namespace, zip(missing, computed))
+        found.update(zip(missing, computed))
+    return [found[text] for text in texts]
+
+
+def hash_series(series, algorithm="sha256", key=None, workers=None, store=None):
+    """列の値をハッシュ化する（同じ値は1回だけ計算する）
+
+    値は str() で文字列にしてからハッシュ化する。欠損値も "nan" としてハッシュ化される。
+    store（HashStore）を渡すと、前に計算した値は計算せずに取り出す。
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    texts = [str(value) for value in uniques]
+    if store is None:
+        digests = hash_strings(texts, algorithm, key, workers)
+    else:
+        digests = _hash_with_store(texts, algorithm, key, workers, store)
+    digests = np.array(digests, dtype=object)
+    return pd.Series(digests[codes], index=series.index, name=series.name)
+
+
+def hash_columns(df, columns, algorithm="sha256", key=None, workers=None, store=None):
+    """選択した列をハッシュ化したDataFrameを返す（元のDataFrameは変更しない）"""
+    hashed = df.copy()
+    for column in columns:
+        hashed[column] = hash_series(df[column], algorithm, key, workers, store)
+    return hashed
+
+
+def restore_values(digests, master, algorithm="sha256", key=None, workers=None, store=None):
+    """ハッシュ値の列を、元の値の一覧（master）と突き合わせて元の値に戻す
+
+    master をハッシュ化してハッシュ値→元の値の索引を作り、digests を1件ずつ引く。
+    store を渡すと索引はSQLite側（ハッシュ値のインデックス）を使い、master のうち保存済みの値は計算しない。
+    一致しなかったハッシュ値は欠損値になる。
+    """
+    master = pd.Series(master).drop_duplicates()
+    master_digests = hash_series(master, algorithm, key, workers, store)
+    wanted = pd.Series(digests)
+    if store is None:
+        index = dict(zip(master_digests, master.astype(str)))
+    else:
+        index = store.reverse_lookup(namespace_for(algorithm, key), list(wanted.dropna().astype(str).unique()))
+        # 以前ほかのファイルで保存した値は、今回の master に含まれていなければ使わない
+        allowed = set(master.astype(str))
+        index = {digest: value for digest, value in index.items() if value in allowed}
+    return wanted.map(index)
+
+
+def hash_csv_stream(source, destination, columns, algorithm="sha256", key=None, encoding="shift-jis",
+                    output_encoding="shift-jis", chunksize=200_000, workers=None, on_chunk=None, store=None):
+    """CSVを chunksize 行ずつ読み、選択した列だけをハッシュ化して destination に追記していく
+
+    メモリに載るのは常に1チャンク分だけ。チャンクごとに型の推定が変わらないよう、
+    値はファイルに書かれている文字列のままハッシュ化する（空欄は "nan" になる）。
+    チャンクを書き終えるたびに on_chunk(処理済みの行数) を呼び、最後に総行数を返す。
+    """
+    reader = pd.read_csv(source, encoding=encoding, usecols=columns, dtype=str, chunksize=chunksize)
+    rows = 0
+    with open(destination, "w", newline="", encoding=output_encoding) as out:
+        for i, chunk in enumerate(reader):
+            hashed = pd.DataFrame({column: hash_series(chunk[column], algorithm, key, workers, store) for column in columns})
+            hashed.to_csv(out, header=(i == 0), index=False)
+            rows += len(chunk)
+            if on_chunk:
+                on_chunk(rows)
+    return rows
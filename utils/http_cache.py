@@ -0,0 +1,150 @@
+"""取得したHTMLをディスクに保存して使い回す共通キャッシュ"""
+import functools
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from pathlib import Path
+from urllib.parse import urlsplit
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache"
+
+# サイトごとの有効期限（秒）。ここにないサイトは DEFAULT_TTL を使う
+SITE_TTL = {
+    "www.cosme.net": 24 * 60 * 60,
+    "www.qoo10.jp": 6 * 60 * 60,
+    "review.rakuten.co.jp": 6 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+# キャッシュ全体の上限サイズ（圧縮後のバイト数）
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+CacheEntry = namedtuple("CacheEntry", ["body", "etag", "last_modified", "fresh"])
+
+
+class HttpCache:
+    """URLをキーにしてレスポンス本文を圧縮してSQLiteに保存する
+
+    有効期限内ならそのまま返し、期限切れでもETag/Last-Modifiedがあれば
+    再検証に使えるように残しておく。容量を超えたら最後に使った日時が古い順に消す。
+    """
+
+    def __init__(self, path=CACHE_DIR / "http_cache.sqlite", max_bytes=DEFAULT_MAX_BYTES,
+                 site_ttl=None, default_ttl=DEFAULT_TTL):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.site_ttl = dict(SITE_TTL if site_ttl is None else site_ttl)
+        self.default_ttl = default_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def ttl_for(self, url):
+        """URLのホスト名から有効期限を決める"""
+        return self.site_ttl.get(urlsplit(url).netloc, self.default_ttl)
+
+    def lookup(self, url):
+        """キャッシュを探す。見つからなければNone、期限切れなら fresh=False で返す"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url))
+            body, etag, last_modified, fetched_at = row
+            fresh = now - fetched_at < self.ttl_for(url)
+            if fresh:
+                self.hits += 1
+        return CacheEntry(zlib.decompress(body), etag, last_modified, fresh)
+
+    def refresh(self, url):
+        """304 Not Modified が返ってきたときに有効期限を延長する"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url)
+            )
+            self.revalidated += 1
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """サイトから取得した本文を保存する"""
+        compressed = zlib.compress(body, 6)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, compressed, len(compressed), etag, last_modified, now, now),
+            )
+            self._total_bytes += len(compressed) - (old[0] if old else 0)
+            self.misses += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 上限の9割に収まるまで、使われていない順に削除する
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute("SELECT url, size FROM responses ORDER BY accessed_at").fetchall()
+        doomed = []
+        for url, size in rows:
+            if self._total_bytes <= target:
+                break
+            doomed.append((url,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE url = ?", doomed)
+
+    def stats(self):
+        """ヒット数・ミス数と保存件数・サイズを返す"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "entries": entries,
+                "bytes": self._total_bytes,
+            }
+
+    def clear(self):
+        """キャッシュをすべて削除する"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.execute("VACUUM")
+            self._total_bytes = 0
+
+
+@functools.lru_cache(maxsize=None)
+def shared_cache():
+    """全ページで共有するキャッシュ（プロセスにつき1つ）"""
+    return HttpCache()
+
+
+def format_stats(cache):
+    """画面表示用にキャッシュの統計を文字列にする"""
+    stats = cache.stats()
+    return (
+        f"キャッシュ: ヒット {stats['hits']}件 / 再検証 {stats['revalidated']}件 / "
+        f"取得 {stats['misses']}件（保存 {stats['entries']}件, {stats['bytes'] / 1024 / 1024:.1f}MB）"
+    )
@@ -0,0 +1,115 @@
+"""アップロードされたファイルを表として読み込む
+
+CSVは先頭の数KBから文字コードを判定して1回だけ解析する（pyarrowがあればマルチスレッドで読む）。
+Excel・Parquetも同じ関数で読める。読み込んだ表はファイルの中身のハッシュ値ごとにキャッシュする。
+"""
+import codecs
+import hashlib
+import io
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# 文字コードの判定に使う先頭のバイト数
+SNIFF_BYTES = 64 * 1024
+
+# 受け付ける拡張子（file_uploader の type にそのまま渡せる）
+TABLE_TYPES = ["csv", "xlsx", "xls", "parquet"]
+
+
+def sniff_encoding(head):
+    """先頭のバイト列から文字コードを判定する（BOM → UTF-8 → CP932 の順）"""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    # 途中で切れた文字があってもエラーにならないよう、続きがある前提で復号してみる
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    # Shift-JIS（Excelが書き出すCSV）はWindowsの拡張文字も含むCP932として読む
+    return "cp932"
+
+
+def _read_csv_arrow(data, encoding):
+    read_options = pa_csv.ReadOptions(encoding="utf8" if encoding == "utf-8-sig" else encoding)
+    # レビュー本文のように、引用符の中で改行している値があっても読めるようにする
+    parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+    # pandasは日付や時刻を文字列のまま読むので、同じ結果になるようその列は文字列として読む
+    # （型は先頭のブロックから推定されるので、先頭のブロックだけ読んで日付・時刻の列を調べる）
+    head = pa_csv.open_csv(io.BytesIO(data), read_options=read_options, parse_options=parse_options)
+    temporal = {field.name: pa.string() for field in head.schema if pa.types.is_temporal(field.type)}
+    head.close()
+    convert_options = pa_csv.ConvertOptions(strings_can_be_null=True, column_types=temporal)
+    table = pa_csv.read_csv(io.BytesIO(data), read_options=read_options, parse_options=parse_options,
+                            convert_options=convert_options)
+    # 文字コードが合わない列はバイト列として読まれるので、復号の失敗として扱う
+    if any(pa.types.is_binary(field.type) for field in table.schema):
+        raise UnicodeDecodeError(encoding, data[:1], 0, 1, "invalid byte sequence")
+    return table.to_pandas()
+
+
+def _parse_csv(data, encoding):
+    if HAS_PYARROW:
+        try:
+            return _read_csv_arrow(data, encoding)
+        except pa.ArrowInvalid:
+            # 列数が行ごとに違うなど、pyarrowが読めないCSVはpandasで読む
+            pass
+    return pd.read_csv(io.BytesIO(data), encoding=encoding)
+
+
+def read_csv_bytes(data, encoding=None):
+    """CSVのバイト列を読み込む。encoding を省略すると先頭から判定する"""
+    encoding = encoding or sniff_encoding(data[:SNIFF_BYTES])
+    try:
+        return _parse_csv(data, encoding)
+    except UnicodeDecodeError:
+        # 先頭が英数字だけのShift-JISファイルはUTF-8と判定されるので、CP932で読み直す
+        if encoding != "utf-8":
+            raise
+        return _parse_csv(data, "cp932")
+
+
+def read_table_bytes(data, name):
+    """ファイル名の拡張子に合わせてバイト列を表として読み込む"""
+    suffix = Path(name).suffix.lower()
+    if suffix in (".xlsx", ".xls"):
+        return pd.read_excel(io.BytesIO(data))
+    if suffix == ".parquet":
+        return pd.read_parquet(io.BytesIO(data))
+    return read_csv_bytes(data)
+
+
+@st.cache_data(show_spinner="ファイルを読み込み中...", max_entries=8)
+def _load_cached(_data, digest, name):
+    # _data は大きいのでキャッシュのキーにせず、中身のハッシュ値 digest で見分ける
+    return read_table_bytes(_data, name)
+
+
+def upload_digest(uploaded_file):
+    """アップロードされたファイルの中身のハッシュ値（キャッシュのキーに使う）"""
+    return hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+
+
+def load_upload(uploaded_file):
+    """file_uploader で受け取ったファイルを表として読み込む（同じ中身なら再解析しない）"""
+    return _load_cached(uploaded_file.getvalue(), upload_digest(uploaded_file), uploaded_file.name)
+
+
+def upload_encoding(uploaded_file):
+    """アップロードされたCSVの文字コードを判定する（ファイルの位置は先頭に戻す）"""
+    uploaded_file.seek(0)
+    head = uploaded_file.read(SNIFF_BYTES)
+    uploaded_file.seek(0)
+    return sniff_encoding(head)
@@ -0,0 +1,66 @@
+"""長いスクレイピングの途中結果を表示する部品"""
+import time
+from collections import deque
+
+import pandas as pd
+import streamlit as st
+
+
+class LiveResults:
+    """取得中の結果を1つの表と1行の進捗表示にまとめて、少しずつ更新する
+
+    画面には直近 max_rows 件だけを出し、更新は flush_every 件ごとか flush_seconds 秒ごとにまとめて行う。
+    取得した行はすべて rows に残る。
+    """
+
+    def __init__(self, total_pages=None, columns=None, max_rows=200, flush_every=50, flush_seconds=1.0):
+        self.total_pages = total_pages
+        self.columns = columns
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.rows = []
+        self.pages = 0
+
+        self._counter = st.empty()
+        self._progress = st.progress(0) if total_pages else None
+        self._table = st.empty()
+        self._recent = deque(maxlen=max_rows)
+        self._pending = 0
+        self._start = time.monotonic()
+        self._flushed_at = self._start
+
+    def add(self, row):
+        """1件追加する"""
+        self.rows.append(row)
+        self._recent.append(row)
+        self._pending += 1
+        if self._pending >= self.flush_every or time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush()
+
+    def extend(self, rows):
+        """まとめて追加する"""
+        for row in rows:
+            self.add(row)
+
+    def page_done(self, page=None):
+        """1ページ取得し終えたことを記録する"""
+        self.pages += 1
+        if self._progress is not None:
+            self._progress.progress(min(1.0, (page or self.pages) / self.total_pages))
+        self._update_counter()
+
+    def _update_counter(self):
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        total = f"/{self.total_pages}" if self.total_pages else ""
+        self._counter.write(
+            f"📥 {len(self.rows)}件・{self.pages}{total}ページ取得 "
+            f"（{len(self.rows) / elapsed:.1f}件/秒, {self.pages / elapsed:.2f}ページ/秒）"
+        )
+
+    def flush(self):
+        """溜まっている分を画面に反映する"""
+        self._update_counter()
+        if self._recent:
+            self._table.dataframe(pd.DataFrame(list(self._recent), columns=self.columns), use_container_width=True)
+        self._pending = 0
+        self._flushed_at = time.monotonic()
@@ -0,0 +1,55 @@
+"""複数プロセスでの並列処理"""
+import contextlib
+import multiprocessing
+import sys
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+
+@contextlib.contextmanager
+def _hide_main_script():
+    # spawnで起動した子プロセスは親の __main__ のファイルを読み直す。
+    # Streamlitではそれがページのスクリプトなので、子プロセスの起動中だけ空のモジュールに差し替える
+    main = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+@contextlib.contextmanager
+def process_pool(workers, initializer=None, initargs=()):
+    """何回も map_in_processes に渡して使い回すプロセスプール（抜けるときに終了させる）"""
+    # Streamlitのサーバー内でforkすると固まることがあるのでspawnで起動する
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
+    try:
+        yield executor
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def map_in_processes(func, items, workers=None, initializer=None, initargs=(), executor=None):
+    """items の各要素に func を複数プロセスで適用し、結果を items と同じ順番で返すジェネレーター
+
+    func と initializer はモジュールの外から見える関数（ページのスクリプト以外で定義したもの）にすること。
+    executor に process_pool() のプールを渡すとそれを使い、渡さなければこの呼び出しの間だけプールを作る。
+    """
+    with contextlib.ExitStack() as stack:
+        if executor is None:
+            executor = stack.enter_context(process_pool(workers, initializer, initargs))
+        # 子プロセスはsubmitの中で起動されるので、まとめて投入してから __main__ を戻す
+        with _hide_main_script():
+            futures = [executor.submit(func, item) for item in items]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # 途中でやめたときは残りを取り消す（使い回すプールは終了させない）
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,134 @@
+"""レビューページ用の軽量なHTML解析
+
+ページ全体からBeautifulSoupの木を作るのをやめ、lxml（C実装）で解析してから
+XPathで必要な要素だけを取り出す。lxmlが入っていない環境ではBeautifulSoupに戻るが、
+その場合も SoupStrainer で必要な要素だけを木にする。
+"""
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+
+def _has_class(tag, name):
+    """CSSの tag.name に相当するXPath"""
+    return f"{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]"
+
+
+# @cosme 口コミ一覧の「続きを読む」リンク（span.read-more a.cmn-viewmore）
+_COSME_LINKS = "//" + _has_class("span", "read-more") + "//" + _has_class("a", "cmn-viewmore")
+# @cosme 口コミ詳細の各項目
+_COSME_READ = "//" + _has_class("p", "read")
+_COSME_RATING = "//" + _has_class("div", "rating") + "[contains(concat(' ', normalize-space(@class), ' '), ' clearfix ')]//" + _has_class("p", "reviewer-rating")
+_COSME_INFO = "//" + _has_class("div", "reviewer-info")
+# Qoo10 のレビュー本文とページング
+_QOO10_REVIEWS = "//" + _has_class("p", "review_txt")
+_QOO10_PAGING = "//div[@id='pagingQA']"
+
+_COSME_LINKS_STRAINER = SoupStrainer("span", class_="read-more")
+_COSME_REVIEW_STRAINER = SoupStrainer(class_=re.compile(r"(?:^|\s)(?:read|rating|reviewer-info)(?:\s|$)"))
+
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+_SKIP_TAGS = {"script", "style", "template"}
+# XHTMLの先頭の <?xml ... encoding="..."?>（文字列にしたあとで lxml に渡すとエラーになる）
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+def _tree(html):
+    # metaタグが無いページでも文字化けしないよう、UTF-8で読めるものは先に文字列にしておく
+    if isinstance(html, bytes):
+        try:
+            html = html.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    if isinstance(html, str):
+        html = _XML_DECLARATION.sub("", html, count=1)
+    return lxml.html.fromstring(html)
+
+
+def _text(element):
+    """BeautifulSoupの get_text() と同じ結果になるようにテキストをつなげる"""
+    parts = []
+
+    def add(chunk):
+        # BeautifulSoupは空白だけのテキストを改行1つ（改行を含まなければ空白1つ）に縮めるので合わせる
+        if not chunk.strip(_ASCII_SPACES):
+            chunk = "\n" if "\n" in chunk else " "
+        parts.append(chunk)
+
+    def walk(node):
+        # コメントやscript/styleの中身は get_text() に含まれない
+        if not isinstance(node.tag, str) or node.tag in _SKIP_TAGS:
+            return
+        if node.text:
+            add(node.text)
+        for child in node:
+            walk(child)
+            if child.tail:
+                add(child.tail)
+
+    walk(element)
+    return "".join(parts)
+
+
+def _first(tree, xpath):
+    found = tree.xpath(xpath)
+    return found[0] if found else None
+
+
+def cosme_review_links(html):
+    """口コミ一覧ページから詳細ページのURLを順番に取り出す"""
+    if HAS_LXML:
+        return [a.get("href") for a in _tree(html).xpath(_COSME_LINKS)]
+    soup = BeautifulSoup(html, "html.parser", parse_only=_COSME_LINKS_STRAINER)
+    return [a.get("href") for a in soup.select("span.read-more a.cmn-viewmore")]
+
+
+def cosme_review_fields(html):
+    """口コミ詳細ページから本文・評価・レビュアー情報のテキストを取り出す
+
+    見つからない項目はNoneになる。
+    """
+    if HAS_LXML:
+        tree = _tree(html)
+        read = _first(tree, _COSME_READ)
+        rating = _first(tree, _COSME_RATING)
+        if rating is not None:
+            rating_text = _text(rating)
+            # BeautifulSoup版の extract() と同じく、評価はレビュアー情報から外しておく
+            rating.drop_tree()
+        else:
+            rating_text = None
+        info = _first(tree, _COSME_INFO)
+        return {
+            "comment": _text(read).strip() if read is not None else None,
+            "rating": rating_text,
+            "reviewer_info": _text(info).strip() if info is not None else None,
+        }
+
+    soup = BeautifulSoup(html, "html.parser", parse_only=_COSME_REVIEW_STRAINER)
+    read = soup.select_one("p.read")
+    rating = soup.select_one("div.rating.clearfix p.reviewer-rating")
+    rating_text = rating.extract().text if rating else None
+    info = soup.select_one("div.reviewer-info")
+    return {
+        "comment": read.get_text().strip() if read else None,
+        "rating": rating_text,
+        "reviewer_info": info.text.strip() if info else None,
+    }
+
+
+def qoo10_reviews(html):
+    """Qoo10の商品ページからレビュー本文のリストと、ページングの有無を返す"""
+    if HAS_LXML:
+        tree = _tree(html)
+        texts = [_text(p).strip() for p in tree.xpath(_QOO10_REVIEWS)]
+        return texts, bool(tree.xpath(_QOO10_PAGING))
+    soup = BeautifulSoup(html, "html.parser")
+    texts = [p.text.strip() for p in soup.find_all("p", class_="review_txt")]
+    return texts, soup.find("div", id="pagingQA") is not None
@@ -0,0 +1,49 @@
+"""大きな表を一部だけ表示する部品"""
+import pandas as pd
+import streamlit as st
+
+# 一度に表示する行数の上限（「さらに表示」を押してもこれ以上は送らない）
+MAX_ROWS = 2000
+
+
+def column_stats(df):
+    """カラムごとの型・欠損数・種類数・値の例を表にする"""
+    return pd.DataFrame({
+        "型": df.dtypes.astype(str),
+        "欠損数": df.isna().sum(),
+        "種類数": df.nunique(),
+        # 数値と文字列が混ざるとブラウザに送れないので、値の例は文字列にする
+        "値の例": [str(df[column].dropna().iloc[0]) if df[column].notna().any() else None for column in df.columns],
+    })
+
+
+def show_preview(df, key, page_size=100):
+    """DataFrameの一部（ページ送りかランダム抽出）だけをブラウザに送って表示する
+
+    key は同じページに複数置くときに区別するための名前。表示行数は「さらに表示」で page_size ずつ増える。
+    """
+    rows_key = f"{key}_rows"
+    rows = st.session_state.get(rows_key, page_size)
+    total = len(df)
+    st.caption(f"全{total:,}行 × {len(df.columns)}列")
+
+    mode = st.radio("表示方法", ["ページ送り", "ランダム抽出"], horizontal=True, key=f"{key}_mode")
+    if mode == "ページ送り":
+        pages = max(1, -(-total // rows))
+        page_key = f"{key}_page"
+        # 小さいファイルに替えたときや表示行数を増やしたときは、前のページ番号が範囲外になるので収める
+        st.session_state[page_key] = min(max(1, int(st.session_state.get(page_key, 1))), pages)
+        page = st.number_input(f"ページ（全{pages:,}ページ）", min_value=1, max_value=pages, step=1, key=page_key)
+        start = (page - 1) * rows
+        st.dataframe(df.iloc[start:start + rows])
+    else:
+        # 再実行しても同じ行が出るように乱数は固定する
+        st.dataframe(df.sample(min(rows, total), random_state=0))
+
+    if rows < min(total, MAX_ROWS):
+        if st.button(f"➕ さらに{page_size}行表示", key=f"{key}_more"):
+            st.session_state[rows_key] = min(rows + page_size, MAX_ROWS)
+            st.rerun()
+
+    if st.checkbox("カラムごとの統計を表示", key=f"{key}_stats"):
+        st.dataframe(column_stats(df))
@@ -0,0 +1,86 @@
+"""Qoo10のレビュー取得処理"""
+import re
+
+import requests
+
+from utils.parsing import qoo10_reviews
+
+# 商品ページのレビュータブが読み込むレビュー一覧（ページ番号をクエリで渡す）
+# 商品ページURLの「#customerReview?page=」はフラグメントでサーバーに送られないため使わない
+# この一覧が使えるかは実行のたびに確かめる（1ページ目に商品ページと同じレビューが載っているか）。
+# 確かめられなければ、商品ページに載っているレビューだけを読む（以前と同じ取り方）
+REVIEW_LIST_URL = "https://www.qoo10.jp/gmkt.inc/Goods/ReviewList.aspx?goodscode={goods_code}&page_no={page}"
+
+_GOODS_CODE_PATTERNS = [
+    re.compile(r"/g/(\d+)"),
+    re.compile(r"[?&]goodscode=(\d+)", re.IGNORECASE),
+    re.compile(r"/item/[^/]+/(\d+)"),
+]
+
+
+def goods_code_from_url(url):
+    """商品URLから商品番号を取り出す"""
+    for pattern in _GOODS_CODE_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    raise ValueError(f"商品番号が見つかりません: {url}")
+
+
+def review_page_url(goods_code, page):
+    """レビュー一覧の指定ページのURL"""
+    return REVIEW_LIST_URL.format(goods_code=goods_code, page=page)
+
+
+def goods_page_reviews(url, fetcher):
+    """商品ページそのものに載っているレビュー本文のリスト（取得できなければ None）"""
+    try:
+        body = fetcher.get(url.split("#")[0])
+    except requests.RequestException:
+        return None
+    texts, _ = qoo10_reviews(body)
+    return texts
+
+
+def list_matches_goods_page(texts, goods_texts):
+    """レビュー一覧の1ページ目が、この商品のレビュー一覧として正しく取れているか
+
+    商品ページにもレビューが載っていれば、その中の1件以上が一覧の1ページ目にもあることを確かめる。
+    商品ページのレビューが取れない（None か空）ときは、一覧にレビューがあればよいことにする。
+    """
+    if not texts:
+        return False
+    if not goods_texts:
+        return True
+    return not set(texts).isdisjoint(goods_texts)
+
+
+def iter_review_pages(url, fetcher, max_pages=None, window=4):
+    """レビューをページ単位で (ページ番号, レビュー本文のリスト) として順番に返すジェネレーター
+
+    window ページずつまとめて並列に取得する。取得に失敗したページ、レビューが無いページか、
+    直前と同じ内容のページ（ページ番号が効いていない）に来たらそこで終了する。
+    レビュー一覧の1ページ目が取れないか商品ページの内容と合わないときは、
+    商品ページのレビューを1ページ目として返して終わる。
+    """
+    goods_code = goods_code_from_url(url)
+    goods_texts = goods_page_reviews(url, fetcher)
+    page = 1
+    previous = None
+    while max_pages is None or page <= max_pages:
+        last = page + window - 1 if max_pages is None else min(page + window - 1, max_pages)
+        pages = list(range(page, last + 1))
+        # 1ページずつの成否を見る（最後のページの次が404でも、それまでのページは使う）
+        bodies = fetcher.get_many([review_page_url(goods_code, p) for p in pages], return_exceptions=True)
+
+        for p, body in zip(pages, bodies):
+            texts = [] if isinstance(body, Exception) else qoo10_reviews(body)[0]
+            if p == 1 and not list_matches_goods_page(texts, goods_texts):
+                if goods_texts:
+                    yield 1, goods_texts
+                return
+            if not texts or texts == previous:
+                return
+            yield p, texts
+            previous = texts
+        page = last + 1
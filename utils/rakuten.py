@@ -0,0 +1,180 @@
+"""楽天市場のレビュー取得処理
+
+まずは普通のHTTPでページを取得し、HTMLに含まれるレビュー（またはJSON-LDの構造化データ）を読む。
+それで見つからないときだけ、ブラウザで描画してから読み直す。
+"""
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from utils.parsing import HAS_LXML
+from utils.reviewer_attrs import extract_attributes
+
+BASE_URL = "https://review.rakuten.co.jp/item/1/{product_id}?p="
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# 1件のレビューとして返す項目
+FIELDS = ["score", "reviewer_info", "comment"]
+
+_REVIEW_SELECTOR = "div[class*='review-detail']"
+
+
+def review_page_url(product_id, page):
+    """商品IDとページ番号からレビューページのURLを作る"""
+    return BASE_URL.format(product_id=product_id) + str(page)
+
+
+def parse_reviews(html):
+    """描画済み（またはサーバー側で描画された）HTMLからレビューを取り出す"""
+    soup = BeautifulSoup(html, "lxml" if HAS_LXML else "html.parser")
+    rows = []
+    for review in soup.select(_REVIEW_SELECTOR):
+        # レビュー本文を取得
+        body = review.select_one("div[class*='review-body']")
+        if body is None:
+            continue
+
+        # 評価を取得
+        score = None
+        score_element = review.select_one("div[class*='review-rating'] span")
+        if score_element:
+            score_match = re.search(r'(\d+)', score_element.get_text().strip())
+            if score_match:
+                score = int(score_match.group(1))
+
+        # レビュアー情報はそのまま保存し、年代と性別はあとでまとめて取り出す
+        reviewer_info = review.select_one("div[class*='reviewer-info']")
+        rows.append({
+            "score": score,
+            "reviewer_info": reviewer_info.get_text().strip() if reviewer_info else None,
+            "comment": body.get_text().strip(),
+        })
+    return rows
+
+
+def _iter_ld_reviews(data):
+    # JSON-LDは入れ子やリストになっていることがあるので、"review" を持つ所を探して回る
+    if isinstance(data, list):
+        for item in data:
+            yield from _iter_ld_reviews(item)
+    elif isinstance(data, dict):
+        reviews = data.get("review")
+        if isinstance(reviews, dict):
+            reviews = [reviews]
+        if isinstance(reviews, list):
+            yield from (review for review in reviews if isinstance(review, dict))
+        for key in ("@graph", "itemReviewed", "mainEntity"):
+            if key in data:
+                yield from _iter_ld_reviews(data[key])
+
+
+def parse_embedded_reviews(html):
+    """HTMLに埋め込まれた構造化データ（JSON-LDのReview）からレビューを取り出す"""
+    soup = BeautifulSoup(html, "lxml" if HAS_LXML else "html.parser")
+    rows = []
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string or "")
+        except ValueError:
+            continue
+        for review in _iter_ld_reviews(data):
+            comment = review.get("reviewBody") or review.get("description")
+            if not comment:
+                continue
+            rating = review.get("reviewRating")
+            score = None
+            if isinstance(rating, dict):
+                match = re.search(r'(\d+)', str(rating.get("ratingValue", "")))
+                if match:
+                    score = int(match.group(1))
+            author = review.get("author")
+            rows.append({
+                "score": score,
+                "reviewer_info": author.get("name") if isinstance(author, dict) else author,
+                "comment": str(comment).strip(),
+            })
+    return rows
+
+
+def to_frame(rows):
+    """取得したレビューを、年代・性別の列を付けたDataFrameにする"""
+    df = pd.DataFrame(list(rows), columns=FIELDS)
+    attrs = extract_attributes(df["reviewer_info"])
+    return pd.DataFrame({
+        "score": df["score"].astype("Int64"),
+        "age": attrs["age_range"],
+        "gender": attrs["gender"],
+        "comment": df["comment"],
+        "reviewer_info": df["reviewer_info"],
+    })
+
+
+def render_page(pool, url, timeout=10):
+    """ブラウザでページを開き、レビューが表示されたらHTMLを返す（見つからなければNone）"""
+    with pool.driver() as driver:
+        driver.get(url)
+        # レビュー要素が表示されるまで待機
+        try:
+            WebDriverWait(driver, timeout).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, _REVIEW_SELECTOR))
+            )
+        except TimeoutException:
+            return None
+        return driver.page_source.encode('utf-8')
+
+
+def fetch_page(url, fetcher, pool, use_http=True):
+    """1ページ分のレビューを取得する。(レビューのリスト, 取得方法) を返し、見つからなければリストは空
+
+    use_http=True のときはHTTPで取れたHTMLを先に試し、レビューが読めなければブラウザに切り替える。
+    ブラウザで描画したHTMLは同じURLでキャッシュに入れておくので、次回はHTTPの段階で読める。
+    """
+    if use_http:
+        try:
+            html = fetcher.get(url)
+            rows = parse_reviews(html) or parse_embedded_reviews(html)
+        except requests.RequestException:
+            # ブロックされた場合などはブラウザで取り直す
+            rows = []
+        if rows:
+            return rows, "http"
+
+    html = render_page(pool, url)
+    if html is None:
+        return [], "browser"
+    if fetcher.cache is not None:
+        fetcher.cache.store(url, html)
+    return parse_reviews(html), "browser"
+
+
+def iter_review_pages(product_id, max_pages, fetcher, pool, workers=1, use_http=True):
+    """(ページ番号, レビューのリスト, 取得方法) をページ順に返すジェネレーター
+
+    workers ページずつ並列に取得する（ブラウザが必要なページはプールのブラウザに振り分けられる）。
+    レビューが見つからないページに来たら、そのページを空のリストで返して終了する。
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(1, max_pages + 1, workers):
+            pages = list(range(start, min(start + workers, max_pages + 1)))
+            futures = [
+                executor.submit(fetch_page, review_page_url(product_id, page), fetcher, pool, use_http)
+                for page in pages
+            ]
+            for page, future in zip(pages, futures):
+                rows, method = future.result()
+                yield page, rows, method
+                if not rows:
+                    for rest in futures:
+                        rest.cancel()
+                    return
@@ -0,0 +1,55 @@
+"""アクセス頻度を制御するトークンバケット"""
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    """トークンバケット方式のレート制限
+
+    1秒あたり rate 個のトークンが貯まり（最大 burst 個）、リクエストごとに1個使う。
+    429や5xxが返ってきたら backoff() で速度を半分に落とし、成功が続くと succeed() で少しずつ元に戻す。
+    """
+
+    def __init__(self, rate, burst=1, min_rate=0.1):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """トークンが使えるようになるまで待つ"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def backoff(self, retry_after=None):
+        """混雑を知らせるレスポンスが返ってきたときに速度を落とす"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            # Retry-After の指定があればそれまでは誰も送らない
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+    def succeed(self):
+        """リクエストが成功したら少しずつ元の速度に戻す"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
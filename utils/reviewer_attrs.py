@@ -0,0 +1,53 @@
+"""レビュアー情報の文字列から年齢・肌タイプ・性別を取り出す後処理
+
+スクレイピング時にはレビュアー情報をそのまま保存しておき、まとめてここで分解する。
+キャッシュや途中経過に残っている過去のデータからも、取り直さずに作り直せる。
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# 具体的な年齢（例：32歳）
+AGE_PATTERN = re.compile(r"(\d+歳)")
+# 年代（例：40代前半）
+AGE_RANGE_PATTERN = re.compile(r"(\d+代[前中後半]*)")
+# 肌タイプ（例：乾燥肌、混合肌、普通肌など）。上から順に試す
+SKIN_TYPE_PATTERNS = [
+    re.compile(r"[/／]\s*([^/／\n]*肌)"),
+    re.compile(r"[\s/／]([^/／\s]*肌)"),
+    re.compile(r"([^/／\s]*肌)(?:\s|$)"),
+]
+
+ATTRIBUTES = ["age", "age_range", "skin_type", "gender"]
+
+
+def extract_attributes(info):
+    """レビュアー情報の列をまとめて受け取り、年齢・年代・肌タイプ・性別の列を持つDataFrameを返す
+
+    age は具体的な年齢があればそれを、なければ年代を入れる。見つからない項目は欠損値になる。
+    """
+    info = pd.Series(info, dtype=object).astype("string")
+
+    age_range = info.str.extract(AGE_RANGE_PATTERN, expand=False)
+    age = info.str.extract(AGE_PATTERN, expand=False).fillna(age_range)
+
+    skin_type = info.str.extract(SKIN_TYPE_PATTERNS[0], expand=False)
+    for pattern in SKIN_TYPE_PATTERNS[1:]:
+        skin_type = skin_type.fillna(info.str.extract(pattern, expand=False))
+    skin_type = skin_type.str.strip()
+
+    # 両方書かれている場合は「女性」を優先する
+    is_female = info.str.contains("女性", regex=False, na=False)
+    is_male = info.str.contains("男性", regex=False, na=False)
+    gender = pd.Series(
+        np.select([is_female, is_male], ["女性", "男性"], default=None),
+        index=info.index,
+    ).astype("string")
+
+    return pd.DataFrame({
+        "age": age,
+        "age_range": age_range,
+        "skin_type": skin_type,
+        "gender": gender,
+    })
@@ -0,0 +1,162 @@
+"""レギュレーションの語句で記事を先に手元でチェックする
+
+レギュレーションの表から禁止語句（NGワード）と表現パターン（正規表現）を取り出して1回だけ索引にし、
+記事の段落を1回なぞるだけで、どの段落がどのルールに当たるかを調べる。
+当たった段落（前後の段落つき）と、当たったルールの行だけをモデルに送れば、送るトークンが大きく減る。
+語句も正規表現もないルールの行は、手元では調べられないので本文全体と照らし合わせる。
+語句や正規表現の列は列名で分かるものだけを使う。何も当たらなくても、抵触していないとはみなさない。
+"""
+import re
+import unicodedata
+
+import pandas as pd
+
+from utils.article import regulation_text
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+# 列名にこれらの語を含む列を禁止語句の列とみなす
+PHRASE_COLUMN_WORDS = ("NG", "禁止", "ワード", "キーワード", "語句", "文言", "単語", "用語", "表現")
+# 列名にこれらの語を含む列を正規表現の列とみなす（禁止語句の列より優先する）
+PATTERN_COLUMN_WORDS = ("正規表現", "パターン", "regex", "pattern")
+# 列名にこれらの語を含む列は語句の列にしない（「NG理由」「OK表現」など）
+EXCLUDE_COLUMN_WORDS = ("理由", "説明", "備考", "OK", "言い換え", "代替", "例外")
+# 1つのセルに複数の語句を書くときの区切り（正規表現のセルは | や , を使うので改行だけで区切る）
+_SEPARATORS = re.compile(r"[、,，/／|｜\n]")
+_PATTERN_SEPARATORS = re.compile(r"\n")
+# 当たった段落の前後に何段落ずつつけて送るか
+CONTEXT_PARAGRAPHS = 1
+
+
+def normalize(text):
+    """全角・半角や大文字・小文字の違いをそろえる（索引の語句と記事の両方に使う）"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _split_cell(value, separators=_SEPARATORS):
+    if pd.isna(value):
+        return []
+    return [part.strip() for part in separators.split(str(value)) if part.strip()]
+
+
+def _has_word(column, words):
+    return any(word.lower() in str(column).lower() for word in words)
+
+
+def find_columns(df):
+    """禁止語句の列と正規表現の列の名前を返す（列名で分かるものだけ。なければどちらも空）"""
+    columns = [column for column in df.columns if not _has_word(column, EXCLUDE_COLUMN_WORDS)]
+    pattern_columns = [column for column in columns if _has_word(column, PATTERN_COLUMN_WORDS)]
+    phrase_columns = [column for column in columns
+                      if column not in pattern_columns and _has_word(column, PHRASE_COLUMN_WORDS)]
+    return phrase_columns, pattern_columns
+
+
+class RuleIndex:
+    """レギュレーションの表から作った、語句→ルールの行の索引
+
+    phrases は正規化した語句→ルールの行番号のリスト、patterns は (コンパイルした正規表現, 行番号) のリスト。
+    """
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.regulation = regulation_text(self.df)
+        self.phrase_columns, self.pattern_columns = find_columns(self.df)
+
+        self.phrases = {}
+        for column in self.phrase_columns:
+            for row, value in self.df[column].items():
+                for phrase in _split_cell(value):
+                    rows = self.phrases.setdefault(normalize(phrase), [])
+                    if row not in rows:
+                        rows.append(row)
+
+        self.patterns = []
+        for column in self.pattern_columns:
+            for row, value in self.df[column].items():
+                for pattern in _split_cell(value, _PATTERN_SEPARATORS):
+                    # 小文字にすると \D が \d に変わってしまうので、パターンはそのまま大文字・小文字を無視して使う
+                    try:
+                        self.patterns.append((re.compile(pattern, re.IGNORECASE), row))
+                    except re.error:
+                        # 正規表現として読めないものはそのままの語句として扱う
+                        self.phrases.setdefault(normalize(pattern), []).append(row)
+
+        # 語句か正規表現を持つ行（手元で調べられるルール）
+        self.screened_rows = {row for rows in self.phrases.values() for row in rows} | {row for _, row in self.patterns}
+
+        self._automaton = None
+        self._combined = None
+        if self.phrases and HAS_AHOCORASICK:
+            self._automaton = ahocorasick.Automaton()
+            for phrase in self.phrases:
+                self._automaton.add_word(phrase, phrase)
+            self._automaton.make_automaton()
+        elif self.phrases:
+            # 1つの正規表現にまとめ、先読みで1文字ずつ開始位置をずらして調べる（同じ位置では長い語句を優先する）
+            ordered = sorted(self.phrases, key=len, reverse=True)
+            self._combined = re.compile("(?=(" + "|".join(re.escape(phrase) for phrase in ordered) + "))")
+            # 長い語句に当たれば、その中に含まれる短い語句（「最高級」の「最高」など）にも当たっている
+            self._contained = {phrase: [other for other in self.phrases if other != phrase and other in phrase]
+                               for phrase in self.phrases}
+
+    def __len__(self):
+        return len(self.phrases) + len(self.patterns)
+
+    def _match_phrases(self, text):
+        if self._automaton is not None:
+            return {phrase for _, phrase in self._automaton.iter(text)}
+        if self._combined is None:
+            return set()
+        found = {match.group(1) for match in self._combined.finditer(text)}
+        return found.union(*(self._contained[phrase] for phrase in found))
+
+    def scan(self, paragraphs):
+        """段落ごとに当たった語句とルールの行を調べ、[(段落番号, 語句のリスト, 行番号のリスト)] を返す"""
+        hits = []
+        for number, paragraph in enumerate(paragraphs):
+            text = normalize(paragraph)
+            found = sorted(self._match_phrases(text))
+            rows = {row for phrase in found for row in self.phrases[phrase]}
+            for pattern, row in self.patterns:
+                match = pattern.search(text)
+                if match:
+                    found.append(match.group())
+                    rows.add(row)
+            if rows:
+                hits.append((number, found, sorted(rows)))
+        return hits
+
+    def hit_table(self, paragraphs, hits):
+        """当たった段落・語句・ルールの行の一覧を表にする（画面で確かめる用）"""
+        return pd.DataFrame(
+            [(number + 1, "、".join(found), "、".join(str(row + 1) for row in rows), paragraphs[number])
+             for number, found, rows in hits],
+            columns=["段落", "当たった語句", "ルールの行", "本文"],
+        )
+
+    def relevant_regulation(self, hits):
+        """当たったルールの行だけのレギュレーションの文字列"""
+        rows = sorted({row for _, _, rows in hits for row in rows})
+        return regulation_text(self.df.loc[rows])
+
+    def unscreened_regulation(self):
+        """語句も正規表現もないルールの行だけのレギュレーションの文字列（なければ None）"""
+        rows = [row for row in self.df.index if row not in self.screened_rows]
+        return regulation_text(self.df.loc[rows]) if rows else None
+
+
+def suspicious_passages(paragraphs, hits, context=CONTEXT_PARAGRAPHS):
+    """当たった段落に前後 context 段落をつけ、重なる範囲はつなげた抜粋のリストを返す"""
+    ranges = []
+    for number, _, _ in hits:
+        start, end = max(0, number - context), min(len(paragraphs), number + context + 1)
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ["\n".join(paragraphs[start:end]) for start, end in ranges]
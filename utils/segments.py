@@ -0,0 +1,130 @@
+"""評価・年代・肌タイプなどのグループごとに単語を比べる
+
+形態素解析の結果から「グループ×単語」の出現回数の疎行列を1回で作り、
+すべてのグループの頻出語と特徴語（TF-IDF・ログオッズ比）をまとめて計算する。
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils.tokens import select_tokens
+
+# 年齢（32歳）や年代（40代前半）から「30代」「40代」を取り出す
+_DECADE_PATTERN = r"(\d+)[歳代]"
+
+# 数値の列は種類がこれより多ければ、件数が同じくらいの4グループに分ける
+MAX_NUMERIC_GROUPS = 10
+
+# 一度に比べるグループの数の上限
+MAX_SEGMENTS = 20
+
+
+def segment_labels(values):
+    """グループ分けに使う列を、比べやすいグループ名の列にする
+
+    年齢・年代の列は「○○代」に、種類の多い数値の列は4つの範囲にまとめる。それ以外はそのまま文字列にする。
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        if values.nunique() > MAX_NUMERIC_GROUPS:
+            return pd.qcut(values, 4, duplicates="drop").astype("string")
+        # 欠損値があると評価の 5 が 5.0 になるので、整数だけなら整数として名前にする
+        if (values.dropna() % 1 == 0).all():
+            values = values.astype("Int64")
+        return values.astype("string")
+
+    text = values.astype("string")
+    decades = pd.to_numeric(text.str.extract(_DECADE_PATTERN, expand=False), errors="coerce")
+    # 値のある行のほとんどが年齢・年代なら年代にまとめる
+    if text.notna().any() and decades.notna().sum() >= 0.8 * text.notna().sum():
+        return (decades // 10 * 10).astype("Int64").astype("string") + "代"
+    return text
+
+
+def limit_segments(labels, max_segments=MAX_SEGMENTS):
+    """グループが多すぎるときは、文書数の多い max_segments 個だけを残す（残りは欠損値にする）"""
+    labels = pd.Series(labels)
+    kept = labels.value_counts().index[:max_segments]
+    return labels.where(labels.isin(kept))
+
+
+def segment_term_matrix(table, labels, pos=None, field="surface", min_length=2):
+    """グループ×単語の出現回数の疎行列と、行のグループ名・列の単語・グループごとの文書数を返す
+
+    labels は文書（テキストの行）ごとのグループ名。欠損値の文書は数えない。
+    """
+    labels = pd.Series(labels).reset_index(drop=True)
+    segment_codes, segments = pd.factorize(labels, sort=True)
+    selected = select_tokens(table, pos, field, min_length)
+
+    rows = segment_codes[selected["doc"].to_numpy()]
+    codes = selected[field].cat.codes.to_numpy()
+    used = rows >= 0
+    term_codes, cols = np.unique(codes[used], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(int(used.sum()), dtype=np.int64), (rows[used], cols)),
+        shape=(len(segments), len(term_codes)),
+    )
+    terms = selected[field].cat.categories[term_codes].astype(str)
+    doc_counts = pd.Series(segment_codes[segment_codes >= 0]).value_counts().reindex(range(len(segments)), fill_value=0)
+    return matrix, pd.Index(segments.astype(str)), pd.Index(terms), doc_counts.to_numpy()
+
+
+def tfidf_scores(matrix):
+    """グループを1つの文書とみなしたTF-IDF（グループ×単語の密な配列）"""
+    counts = matrix.toarray().astype(float)
+    tf = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    segment_freq = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(counts)) / (1 + segment_freq)) + 1
+    return tf * idf
+
+
+def log_odds_scores(matrix, prior=0.01):
+    """各グループと残りのグループを比べた、Dirichlet事前分布つきログオッズ比のzスコア（グループ×単語）
+
+    事前分布は全体の単語の割合に prior×総単語数 を掛けたもの（Monroe ほか 2008 の informative prior）。
+    出現回数の少ない単語ほど0に近づくので、たまたま1回だけ出た単語が上位に来にくい。
+    """
+    counts = matrix.toarray().astype(float)
+    totals = counts.sum(axis=0)
+    alpha = prior * totals
+    alpha0 = alpha.sum()
+
+    inside = counts
+    outside = totals - counts
+    n_inside = inside.sum(axis=1, keepdims=True)
+    n_outside = outside.sum(axis=1, keepdims=True)
+
+    delta = (np.log((inside + alpha) / (n_inside + alpha0 - inside - alpha))
+             - np.log((outside + alpha) / (n_outside + alpha0 - outside - alpha)))
+    variance = 1 / (inside + alpha) + 1 / (outside + alpha)
+    return delta / np.sqrt(variance)
+
+
+def top_terms_by_segment(matrix, segments, terms, method="log_odds", top_k=20, min_count=3):
+    """グループごとの上位の単語を、グループを列にした表で返す
+
+    method は "count"（出現回数）・"tfidf"・"log_odds" のどれか。全体で min_count 回未満の単語は使わない。
+    """
+    keep = np.flatnonzero(np.asarray(matrix.sum(axis=0)).ravel() >= min_count)
+    matrix = matrix[:, keep]
+    terms = terms[keep]
+    if method == "count":
+        scores = matrix.toarray().astype(float)
+    elif method == "tfidf":
+        scores = tfidf_scores(matrix)
+    elif method == "log_odds":
+        scores = log_odds_scores(matrix)
+    else:
+        raise ValueError(f"未対応の方法です: {method}")
+
+    counts = matrix.toarray()
+    columns = {}
+    for i, segment in enumerate(segments):
+        # そのグループに出てこない単語は候補にしない
+        candidates = np.flatnonzero(counts[i] > 0)
+        order = candidates[np.argsort(-scores[i, candidates], kind="stable")[:top_k]]
+        columns[segment] = pd.Series([f"{terms[j]}（{counts[i, j]}）" for j in order], dtype=object)
+    table = pd.DataFrame(columns)
+    table.index = table.index + 1
+    return table
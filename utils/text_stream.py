@@ -0,0 +1,71 @@
+"""大きなCSVを少しずつ読みながら単語を数える
+
+CSVを CHUNK_ROWS 行ずつ読み、チャンクごとに形態素解析して出現回数と共起回数を足し合わせていく。
+メモリに載るのは1チャンク分のテキストと、上限までの集計結果だけ。
+"""
+from collections import Counter
+
+import pandas as pd
+
+from utils.cooccurrence import cooccurrence
+from utils.tokens import count_terms, token_table
+
+# 1回に読み込む行数
+CHUNK_ROWS = 20_000
+
+
+def iter_text_chunks(source, column, encoding, chunksize=CHUNK_ROWS):
+    """CSVの1カラムだけを chunksize 行ずつ読み、Series として順に返す"""
+    reader = pd.read_csv(source, encoding=encoding, usecols=[column], dtype=str, chunksize=chunksize)
+    for chunk in reader:
+        yield chunk[column]
+
+
+class RunningCounts:
+    """チャンクごとの出現回数と共起回数を足し合わせていく
+
+    数える単語や組み合わせが上限を超えたら、回数の少ないものから捨てる。
+    捨てたものが後のチャンクでまた出てきたときは0から数え直すので、回数の少ない単語は実際より少なめになる。
+    共起はチャンクごとに、そのチャンクで文書数の多い単語（cooccurrence.MAX_TERMS 語）の間だけで数える。
+    """
+
+    def __init__(self, pos=None, field="surface", max_terms=100_000, max_pairs=300_000):
+        self.pos = pos
+        self.field = field
+        self.max_terms = max_terms
+        self.max_pairs = max_pairs
+        self.terms = Counter()
+        self.pairs = Counter()
+        self.rows = 0
+
+    def add(self, texts, workers=None, pool=None):
+        """テキストのチャンクを解析して集計に足す
+
+        pool には tokens.token_pool() のプールを渡す（チャンクごとにプロセスを起動し直さないよう、
+        呼び出し側でストリーム全体にわたって1つ使い回す）。
+        """
+        table = token_table(texts, workers=workers, pool=pool)
+        self.terms.update(count_terms(table, self.pos, self.field).to_dict())
+        self.pairs.update(cooccurrence(table, self.pos, self.field).to_dict())
+        self.rows += len(texts)
+        self._prune(self.terms, self.max_terms)
+        self._prune(self.pairs, self.max_pairs)
+
+    @staticmethod
+    def _prune(counter, limit):
+        if len(counter) > limit:
+            kept = counter.most_common(limit)
+            counter.clear()
+            counter.update(dict(kept))
+
+    def top_terms(self, n=None):
+        """出現回数の多い単語（単語が索引のSeries）"""
+        return pd.Series(dict(self.terms.most_common(n)), dtype="int64", name="count")
+
+    def top_pairs(self, n=None):
+        """一緒に出てくる文書数の多い単語の組み合わせ"""
+        pairs = self.pairs.most_common(n)
+        index = pd.MultiIndex.from_arrays(
+            [[pair[0] for pair, _ in pairs], [pair[1] for pair, _ in pairs]], names=["単語1", "単語2"]
+        )
+        return pd.Series([count for _, count in pairs], index=index, dtype="int64", name="count")
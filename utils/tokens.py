@@ -0,0 +1,196 @@
+"""テキストの形態素解析結果を表にして使い回す
+
+カラムのテキストを1回だけMeCabで解析し、1行1単語の表（文書番号・表層形・原形・品詞）にする。
+品詞の絞り込みや集計はこの表への問い合わせで済むので、条件を変えても解析し直さない。
+"""
+import collections
+import contextlib
+import os
+import threading
+
+import MeCab
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pandas.api.types import union_categoricals
+
+from utils.parallel import map_in_processes, process_pool
+
+# 原形が入っている素性の位置（UniDicは書字形の基本形、IPA辞書は原形）
+_UNIDIC_BASE = 10
+_IPADIC_BASE = 6
+
+# テキストがこれ以上あるときだけ複数プロセスで解析する（少ないとプロセスとTaggerの起動の方が遅い）
+PARALLEL_THRESHOLD = 20_000
+# 1回に1プロセスへ渡すテキストの数
+CHUNK_SIZE = 5_000
+
+# 解析結果を残しておく数（ファイル×カラムごと。古いものから消す）
+MAX_CACHED = 4
+
+# Taggerはスレッドセーフではないので、Streamlitのセッションのスレッドごとに持つ
+_local = threading.local()
+
+
+def _get_tagger():
+    # Taggerの作成は辞書を読むので重い。スレッドごとに1つだけ作って使い回す
+    tagger = getattr(_local, "tagger", None)
+    if tagger is None:
+        tagger = _local.tagger = MeCab.Tagger()
+    return tagger
+
+
+def _base_form(features, surface):
+    if len(features) > _UNIDIC_BASE:
+        base = features[_UNIDIC_BASE]
+    elif len(features) > _IPADIC_BASE:
+        base = features[_IPADIC_BASE]
+    else:
+        # 未知語は原形がないので表層形を使う
+        base = "*"
+    return surface if base in ("", "*") else base
+
+
+def tokenize(texts, start=0):
+    """テキストの並びを形態素解析して (文書番号, 表層形, 原形, 品詞) の4つのリストを返す
+
+    文書番号は start から数える。欠損値の行は単語なしとして番号だけ進める。
+    """
+    tagger = _get_tagger()
+    docs, surfaces, bases, pos = [], [], [], []
+    for doc, text in enumerate(texts, start):
+        if pd.isna(text):
+            continue
+        node = tagger.parseToNode(str(text))
+        while node:
+            surface = node.surface
+            # 文頭・文末のノードは表層形が空
+            if surface:
+                features = node.feature.split(",")
+                docs.append(doc)
+                surfaces.append(surface)
+                bases.append(_base_form(features, surface))
+                pos.append(features[0])
+            node = node.next
+    return docs, surfaces, bases, pos
+
+
+def _to_frame(docs, surfaces, bases, pos):
+    # 文字列の列はカテゴリ型にして小さくする（プロセス間で受け渡す量も減る）
+    return pd.DataFrame({
+        "doc": np.array(docs, dtype=np.int32),
+        "surface": pd.Categorical(surfaces),
+        "lemma": pd.Categorical(bases),
+        "pos": pd.Categorical(pos),
+    })
+
+
+def _init_worker():
+    # 子プロセスごとに最初に1回だけTaggerを作っておく
+    _get_tagger()
+
+
+def _tokenize_chunk(args):
+    # 別プロセスで呼ばれるのでモジュールの外から見える関数にしておく
+    texts, start = args
+    return _to_frame(*tokenize(texts, start))
+
+
+def _concat(frames):
+    if not frames:
+        return _to_frame([], [], [], [])
+    return pd.DataFrame({
+        "doc": np.concatenate([frame["doc"].to_numpy() for frame in frames]),
+        **{column: union_categoricals([frame[column] for frame in frames]) for column in ("surface", "lemma", "pos")},
+    })
+
+
+def token_pool(workers=None):
+    """token_table を何回も呼ぶときに使い回すプロセスプール（1CPUなら None を返すだけ）
+
+    with token_pool() as pool: として、pool を token_table に渡す。
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return contextlib.nullcontext()
+    return process_pool(workers, initializer=_init_worker)
+
+
+def token_table(texts, workers=None, on_progress=None, pool=None):
+    """テキストの並びを1行1単語の表にする
+
+    テキストが多いときは CHUNK_SIZE 件ずつ複数プロセス（それぞれにTagger）で解析し、元の順番でつなげる。
+    pool に token_pool() のプールを渡すと、件数にかかわらずそのプールで解析する（プロセスを起動し直さない）。
+    1かたまり終わるたびに on_progress(解析済みの件数, 全件数) を呼ぶ。
+    """
+    texts = list(texts)
+    chunks = [(texts[i:i + CHUNK_SIZE], i) for i in range(0, len(texts), CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if pool is not None:
+        parts = map_in_processes(_tokenize_chunk, chunks, executor=pool)
+    elif workers == 1 or len(texts) < PARALLEL_THRESHOLD:
+        parts = map(_tokenize_chunk, chunks)
+    else:
+        parts = map_in_processes(_tokenize_chunk, chunks, min(workers, len(chunks)), initializer=_init_worker)
+
+    frames = []
+    for (chunk, start), frame in zip(chunks, parts):
+        frames.append(frame)
+        if on_progress:
+            on_progress(start + len(chunk), len(texts))
+    return _concat(frames)
+
+
+@st.cache_resource
+def _cache():
+    # 全セッションで共有する（同じファイルを別の人が開いても解析し直さない）
+    return collections.OrderedDict(), threading.Lock()
+
+
+def cached_token_table(texts, key, on_progress=None):
+    """key（ファイルのハッシュ値とカラム名など）ごとに解析結果を使い回す
+
+    返す表は共有されるので、呼び出し側で書き換えないこと。
+    """
+    tables, lock = _cache()
+    with lock:
+        if key in tables:
+            tables.move_to_end(key)
+            return tables[key]
+    table = token_table(texts, on_progress=on_progress)
+    with lock:
+        tables[key] = table
+        while len(tables) > MAX_CACHED:
+            tables.popitem(last=False)
+    return table
+
+
+def _token_mask(table, pos, field, min_length):
+    mask = np.ones(len(table), dtype=bool)
+    if pos is not None:
+        mask &= table["pos"].isin(pos).to_numpy()
+    if min_length > 1:
+        # 文字数は語彙ごとに1回だけ数えて、各行にはその結果を引く
+        terms = table[field]
+        lengths = terms.cat.categories.str.len().to_numpy()
+        mask &= lengths[terms.cat.codes.to_numpy()] >= min_length
+    return mask
+
+
+def select_tokens(table, pos=None, field="surface", min_length=2):
+    """品詞と文字数で単語を絞り込む（pos を省略するとすべての品詞）"""
+    return table[_token_mask(table, pos, field, min_length)]
+
+
+def count_terms(table, pos=None, field="surface", min_length=2):
+    """絞り込んだ単語の出現回数を多い順に返す（単語が索引のSeries）
+
+    カテゴリの番号ごとに数えるので、使うメモリは語彙の数に比例する。
+    同じ回数の単語は先に出てきた順に並べる（collections.Counter.most_common と同じ）。
+    """
+    terms = table[field]
+    codes = terms.cat.codes.to_numpy()[_token_mask(table, pos, field, min_length)]
+    counts = np.bincount(codes, minlength=len(terms.cat.categories))
+    order = pd.unique(codes)
+    result = pd.Series(counts[order], index=terms.cat.categories[order].astype(str), name="count")
+    return result.sort_values(ascending=False, kind="stable")
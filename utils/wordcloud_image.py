@@ -0,0 +1,66 @@
+"""単語の出現回数からワードクラウドのPNG画像を作る"""
+import functools
+import os
+from io import BytesIO
+
+import matplotlib.font_manager as fm
+import streamlit as st
+from wordcloud import WordCloud
+
+
+@functools.lru_cache(maxsize=None)
+def get_font_path():
+    """利用可能な日本語フォントのパスを取得（プロセスにつき1回だけ探す）"""
+    # IPAフォントを優先的に使用（日本語対応）
+    ipa_paths = [
+        "/usr/share/fonts/opentype/ipafont-gothic/ipag.ttf",
+        "/usr/share/fonts/truetype/ipafont/ipag.ttf",
+        "/usr/share/fonts/truetype/ipafont-gothic/ipag.ttf"
+    ]
+
+    for path in ipa_paths:
+        if os.path.exists(path):
+            return path
+
+    # Notoフォントを試す
+    noto_paths = [
+        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc"
+    ]
+
+    for path in noto_paths:
+        if os.path.exists(path):
+            return path
+
+    # システムにインストールされているフォントから日本語フォントを探す（時間がかかる）
+    for font in fm.findSystemFonts():
+        if any(name in font.lower() for name in ['ipa', 'noto', 'gothic', 'mincho']):
+            return font
+
+    return None
+
+
+@st.cache_data(max_entries=32)
+def render_png(frequencies, width=800, height=600, max_words=100, scale=2):
+    """(単語, 回数) の並びからワードクラウドを描いてPNGのバイト列を返す
+
+    同じ出現回数・同じ設定なら描き直さない。画像は width×height の scale 倍の大きさになる。
+    """
+    wordcloud = WordCloud(
+        font_path=get_font_path(),
+        background_color="white",
+        width=width,
+        height=height,
+        scale=scale,
+        min_font_size=10,
+        max_words=max_words,
+        prefer_horizontal=0.7,  # 横書きの比率を調整
+        font_step=1,  # フォントサイズの調整ステップを小さくする
+        repeat=True  # 単語の繰り返しを許可
+    ).generate_from_frequencies(dict(frequencies))
+
+    # 描いた画像をそのままPNGにする（matplotlibの図は作らない）
+    buffer = BytesIO()
+    wordcloud.to_image().save(buffer, format="PNG")
+    return buffer.getvalue()